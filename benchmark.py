@@ -0,0 +1,162 @@
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+import numpy as np
+import programs
+import profiling
+from settings import SETTINGS
+from step0 import verify
+
+
+###
+# Benchmark
+# Runs verify on the programs of programs.py with fixed seeds and compares
+# the results to a stored baseline
+###
+def get_programs(names=None):
+    # every program dict in programs.py, e.g. code_1
+    found = {}
+    for name in sorted(vars(programs)):
+        code = getattr(programs, name)
+        if isinstance(code, dict) and all(key in code for key in ['pre', 'cond', 'body', 'post', 'map']):
+            found[name] = code
+    if names:
+        missing = [name for name in names if name not in found]
+        if missing:
+            raise Exception("Unknown programs: %s." % ', '.join(missing))
+        found = {name: found[name] for name in names}
+    return found
+
+
+def _run(connection, code, seed, workers, trace):
+    # runs in a forked process so that a hanging run can be stopped
+    SETTINGS['PRINT'] = False
+    # every run starts cold
+    SETTINGS['VERIFY']['CACHE'] = None
+    SETTINGS['PROFILE']['ENABLED'] = trace is not None
+    np.random.seed(seed)
+    profiling.reset()
+    # the forked process starts with the pages of the parent
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    try:
+        result = verify(code, workers)
+        result = result if isinstance(result, str) else 'PROVED'
+    except Exception as exception:
+        result = 'ERROR: %s' % exception
+    wall_time = time.perf_counter() - start
+    if trace is not None:
+        profiling.write_trace(trace)
+    connection.send({
+        'result': result,
+        'wall_time': wall_time,
+        'counters': dict(profiling.COUNTERS),
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory
+    })
+
+
+def run(code, seed, workers=1, timeout=300, trace=None):
+    context = multiprocessing.get_context('fork')
+    connection, child_connection = context.Pipe(duplex=False)
+    process = context.Process(target=_run, args=(child_connection, code, seed, workers, trace))
+    start = time.perf_counter()
+    process.start()
+    if connection.poll(timeout):
+        measurement = connection.recv()
+    else:
+        measurement = {
+            'result': 'TIMEOUT',
+            'wall_time': time.perf_counter() - start,
+            'counters': {},
+            'peak_memory_kb': None
+        }
+        process.kill()
+    process.join()
+    measurement['seed'] = seed
+    return measurement
+
+
+def benchmark(codes, repetitions=3, seed=0, workers=1, timeout=300, profile=None):
+    report = {}
+    for name, code in codes.items():
+        runs = [
+            run(code, seed + repetition, workers, timeout,
+                None if profile is None else '%s-%s-%d.json' % (profile, name, seed + repetition))
+            for repetition in range(repetitions)
+        ]
+        wall_times = [measurement['wall_time'] for measurement in runs]
+        report[name] = {
+            'runs': runs,
+            'median_wall_time': float(np.median(wall_times)),
+            'median_rounds': float(np.median([
+                measurement['counters'].get('rounds', 0) for measurement in runs
+            ])),
+            'results': sorted(set(measurement['result'] for measurement in runs))
+        }
+        if SETTINGS['PRINT']:
+            print(SETTINGS['#'], name, report[name]['results'],
+                  '%.3fs' % report[name]['median_wall_time'], file=sys.stderr)
+    return report
+
+
+def compare(report, baseline, tolerance=0.2, floor=0.1):
+    """Returns a list of regressions of the report against the baseline: a
+    slower median wall time or more median rounds (beyond the relative
+    tolerance) or a different set of results. Wall times that differ by less
+    than floor seconds and rounds that differ by at most one are noise."""
+    regressions = []
+    for name, entry in report.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        slower = entry['median_wall_time'] - old['median_wall_time']
+        if slower > floor and entry['median_wall_time'] > old['median_wall_time'] * (1 + tolerance):
+            regressions.append('%s: median wall time %.3fs > %.3fs' % (
+                name, entry['median_wall_time'], old['median_wall_time']))
+        more = entry['median_rounds'] - old['median_rounds']
+        if more > 1 and entry['median_rounds'] > old['median_rounds'] * (1 + tolerance):
+            regressions.append('%s: median rounds %s > %s' % (
+                name, entry['median_rounds'], old['median_rounds']))
+        if entry['results'] != old['results']:
+            regressions.append('%s: results %s != %s' % (
+                name, entry['results'], old['results']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark verify on the programs of programs.py.')
+    parser.add_argument('programs', nargs='*', help='names of the programs, default all')
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300, help='seconds per run')
+    parser.add_argument('--output', help='write the report as json to this file')
+    parser.add_argument('--baseline', help='compare against a report stored with --output')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--floor', type=float, default=0.1, help='seconds of wall time that are noise')
+    parser.add_argument('--profile', help='write a trace of every run to PROFILE-<program>-<seed>.json')
+    arguments = parser.parse_args()
+
+    report = benchmark(
+        get_programs(arguments.programs),
+        arguments.repetitions,
+        arguments.seed,
+        arguments.workers,
+        arguments.timeout,
+        arguments.profile
+    )
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare(report, json.load(file), arguments.tolerance, arguments.floor)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import numpy as np
+from settings import SETTINGS
+from utils import write_atomic
+from points import LABELS
+from frontend import serialize, deserialize
+
+
+# part of the cache key, increase it when the stored data changes
+VERSION = 5
+
+
+# the settings that change the labels of the points or the learned invariant
+KEY_SETTINGS = [
+    ('EVALUATE', 'ACCELERATE'),
+    ('EVALUATE', 'MEMO'),
+    ('EVALUATE', 'SAMPLES'),
+    ('EVALUATE', 'STEPS'),
+    ('SEPARATOR', 'BACKEND'),
+    ('SEPARATOR', 'MAX_DENOMINATOR'),
+    ('HESSE_FORM_MULTIPLIER',),
+    ('VERIFY', 'COUNTEREXAMPLES'),
+    ('VERIFY', 'DISTANCE'),
+    ('VERIFY', 'PRECHECK')
+]
+
+
+###
+# Run cache
+# The points, transitions and invariant of a program in
+# SETTINGS['VERIFY']['CACHE']/<key> if it is set
+###
+def get_key(code):
+    # the order of the map is the order of the state variables
+    parts = [str(VERSION)]
+    for path in KEY_SETTINGS:
+        value = SETTINGS
+        for key in path:
+            value = value[key]
+        parts.append('%s %r' % ('/'.join(path), value))
+    parts += [serialize(code[key]) for key in ['pre', 'cond', 'body', 'post']]
+    parts += [serialize(path) for path in code['paths']]
+    parts += ['%s %d %d' % (name, places['pre'], places['body']) for name, places in code['map'].items()]
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def _get_path(code, name):
+    return os.path.join(SETTINGS['VERIFY']['CACHE'], get_key(code), name)
+
+
+def _read_array(path):
+    if not os.path.exists(path):
+        return None
+    return np.load(path)
+
+
+def load(code, single_points, store=None):
+    # fills single_points and an empty store, returns the invariant or None
+    if SETTINGS['VERIFY']['CACHE'] is None:
+        return None
+
+    # one row per point, the index of its label and the point
+    points = _read_array(_get_path(code, 'points.npy'))
+    if points is not None:
+        for i, label in enumerate(LABELS):
+            single_points.add(label, points[points[:, 0] == i, 1:])
+
+    # one row per state, the state, its successor, its final state and the
+    # number of steps to it
+    transitions = _read_array(_get_path(code, 'transitions.npy'))
+    if store is not None and len(store) == 0 and transitions is not None:
+        store.add(transitions[:, :-3], transitions[:, -3], transitions[:, -2], transitions[:, -1])
+
+    path = _get_path(code, 'invariant.txt')
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return deserialize(file.read(), list(code['map']))
+
+
+def save(code, single_points, store=None, invariant=None):
+    # the points and the store contain what load gave them
+    if SETTINGS['VERIFY']['CACHE'] is None:
+        return
+    points = np.vstack([np.empty((0, single_points.dimension + 1), int)] + [
+        np.column_stack([np.full(single_points.count(label), i), single_points[label]])
+        for i, label in enumerate(LABELS) if label != 'UNKNOWN' and label in single_points
+    ])
+    write_atomic(_get_path(code, 'points.npy'), lambda file: np.save(file, points))
+    if store is not None and len(store) != 0:
+        transitions = np.column_stack([store.states, store.successors, store.finals, store.lengths])
+        write_atomic(_get_path(code, 'transitions.npy'), lambda file: np.save(file, transitions))
+    if invariant is not None:
+        write_atomic(_get_path(code, 'invariant.txt'), lambda file: file.write(invariant.serialize().encode()))
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+###
+# Candidate invariant
+###
+class Candidate:
+    """A candidate invariant as integer matrices, the numeric twin of the
+    formula of find_disjunctive_invariant.
+
+    Every disjunct is a region of the program, given by its path signature,
+    and a conjunction of rows a * x + b * y + c > 0. Row i of weights and
+    offsets belongs to the disjunct disjuncts[i]; a disjunct without rows
+    is its whole region."""
+
+    def __init__(self, dimension=2):
+        self.weights = np.empty((0, dimension), int)
+        self.offsets = np.empty(0, int)
+        self.disjuncts = np.empty(0, int)
+        self.signatures = np.empty(0, int)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, signature, hesse_normal_forms):
+        """Adds the disjunct of the region with the signature and returns
+        its index."""
+        index = len(self)
+        forms = np.array(hesse_normal_forms, int).reshape(-1, self.weights.shape[1] + 1)
+        self.weights = np.vstack([self.weights, forms[:, :-1]])
+        self.offsets = np.append(self.offsets, forms[:, -1])
+        self.disjuncts = np.append(self.disjuncts, np.full(len(forms), index, int))
+        self.signatures = np.append(self.signatures, signature)
+        return index
+
+    def evaluate(self, states, signatures):
+        """Tells for an (N, d) array of states with their path signatures
+        whether they satisfy the candidate."""
+        states = np.asarray(states, float).reshape(-1, self.weights.shape[1])
+        # a float matmul is exact for the values of integer points and faster
+        violated = np.dot(states, self.weights.T.astype(float)) + self.offsets <= 0
+        inside = np.asarray(signatures)[:, None] == self.signatures
+        for index in range(len(self)):
+            inside[:, index] &= ~np.any(violated[:, self.disjuncts == index], axis=1)
+        return np.any(inside, axis=1)
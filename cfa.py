@@ -1,5 +1,7 @@
 import ast
+from array import array
 import astunparse
+import numpy as np
 from enum import Enum
 
 
@@ -38,10 +40,12 @@ class CFANode:
 class InstructionType(Enum):
     STATEMENT = 1
     ASSUMPTION = 2
+    BLOCK = 3
 
 
 class Instruction:
-    """An instruction is either an assignment or an assumption"""
+    """An instruction is either an assignment or an assumption, or a block
+    whose expression is the formula of a whole loop free part of the CFA"""
 
     def __init__(self, expression, kind=InstructionType.STATEMENT, negated=False):
         self.kind = kind
@@ -58,6 +62,15 @@ class Instruction:
     def statement(expression):
         return Instruction(expression)
 
+    @staticmethod
+    def block(formula):
+        return Instruction(formula, kind=InstructionType.BLOCK)
+
+    def label(self):
+        if self.kind == InstructionType.BLOCK:
+            return self.expression.serialize()
+        return astunparse.unparse(self.expression).strip()
+
 
 class CFAEdge:
     def __init__(self, predecessor, successor, instruction):
@@ -75,39 +88,150 @@ class CFAEdge:
         )
 
     def label(self):
-        return astunparse.unparse(self.instruction.expression).strip()
+        return self.instruction.label()
 
 
-class CFACreator(ast.NodeVisitor):
+class CFA:
+    """A CFA in arrays, for large programs.
+
+    Nodes and edges are integer ids numbered per graph. Edge i goes from
+    predecessors[i] to successors[i] and carries instructions[i], an index
+    into the interned instructions; equal instructions are stored once and
+    their labels are only unparsed once. A merged node points to the node
+    it was merged into in parents, so merging does not touch the edges."""
+
     def __init__(self):
-        self.root = CFANode()
+        self.parents = array('q')
+        self.predecessors = array('q')
+        self.successors = array('q')
+        self.instructions = array('q')
+        self.interned = list()
+        self._instructionIds = dict()
+        self._dumped = (None, None)
+        self._labels = dict()
+        self._leaving = None
+
+    def addNode(self):
+        self.parents.append(len(self.parents))
+        return len(self.parents) - 1
+
+    def find(self, node):
+        # the node that node was merged into
+        while self.parents[node] != node:
+            self.parents[node] = self.parents[self.parents[node]]
+            node = self.parents[node]
+        return node
+
+    def intern(self, instruction):
+        expression = instruction.expression
+        if instruction.kind == InstructionType.BLOCK:
+            # formulas are unique objects already
+            key = (instruction.kind, False, expression)
+        else:
+            if instruction.negated:
+                # the negated assumption wraps the test of the one before it
+                expression = expression.operand
+            if self._dumped[0] is not expression:
+                self._dumped = (expression, ast.dump(expression, annotate_fields=False))
+            key = (instruction.kind, instruction.negated, self._dumped[1])
+        if key not in self._instructionIds:
+            self._instructionIds[key] = len(self.interned)
+            self.interned.append(instruction)
+        return self._instructionIds[key]
+
+    def addEdge(self, predecessor, successor, instruction):
+        self.predecessors.append(predecessor)
+        self.successors.append(successor)
+        self.instructions.append(self.intern(instruction))
+        self._leaving = None
+        return len(self.predecessors) - 1
+
+    def merge(self, a, b):
+        # the edges of b become edges of a, like CFANode.merge
+        self.parents[self.find(b)] = self.find(a)
+        self._leaving = None
+        return a
+
+    def leavingEdges(self, node):
+        # the edges sorted by predecessor, computed once after every change
+        if self._leaving is None:
+            parents = np.array(self.parents, dtype=np.int64)
+            while np.any(parents[parents] != parents):
+                parents = parents[parents]
+            predecessors = parents[np.array(self.predecessors, dtype=np.int64)]
+            order = np.argsort(predecessors, kind='stable')
+            offsets = np.searchsorted(predecessors[order], np.arange(len(parents) + 1))
+            self._leaving = (order, offsets)
+        order, offsets = self._leaving
+        node = self.find(node)
+        return [int(edge) for edge in order[offsets[node]:offsets[node + 1]]]
+
+    def enteringEdges(self, node):
+        node = self.find(node)
+        return [edge for edge in range(len(self.successors)) if self.find(self.successors[edge]) == node]
+
+    def successor(self, edge):
+        return self.find(self.successors[edge])
+
+    def predecessor(self, edge):
+        return self.find(self.predecessors[edge])
+
+    def instruction(self, edge):
+        return self.interned[self.instructions[edge]]
+
+    def label(self, edge):
+        instruction = self.instructions[edge]
+        if instruction not in self._labels:
+            self._labels[instruction] = self.interned[instruction].label()
+        return self._labels[instruction]
+
+    def edgeToString(self, edge):
+        return "(%d) -%s-> (%d)" % (self.predecessor(edge), self.label(edge), self.successor(edge))
+
+
+class CFACreator(ast.NodeVisitor):
+    def __init__(self, compact=False):
+        # with compact=True the CFA is built in self.cfa and nodes are ids
+        self.cfa = CFA() if compact else None
+        self.root = self._newNode()
         self.nodestack = list()
         self.nodestack.append(self.root)
 
+    def _newNode(self):
+        return CFANode() if self.cfa is None else self.cfa.addNode()
+
+    def _newEdge(self, predecessor, successor, instruction):
+        if self.cfa is None:
+            return CFAEdge(predecessor, successor, instruction)
+        return self.cfa.addEdge(predecessor, successor, instruction)
+
+    def _merge(self, a, b):
+        return CFANode.merge(a, b) if self.cfa is None else self.cfa.merge(a, b)
+
     def visit_FunctionDef(self, node):
         ast.NodeVisitor.generic_visit(self, node)
 
     def visit_While(self, node):
         entrynode = self.nodestack.pop()
-        inside = CFANode()
-        edge = CFAEdge(entrynode, inside, Instruction.assumption(node.test))
-        outside = CFANode()
-        edge = CFAEdge(
+        inside = self._newNode()
+        edge = self._newEdge(entrynode, inside, Instruction.assumption(node.test))
+        outside = self._newNode()
+        edge = self._newEdge(
             entrynode, outside, Instruction.assumption(node.test, negated=True)
         )
         self.nodestack.append(inside)
         for statement in node.body:
             self.visit(statement)
         bodyexitnode = self.nodestack.pop()
-        CFANode.merge(entrynode, bodyexitnode)
+        self._merge(entrynode, bodyexitnode)
         self.nodestack.append(outside)
 
     def visit_If(self, node):
         entrynode = self.nodestack.pop()
-        left = CFANode()
-        edge = CFAEdge(entrynode, left, Instruction.assumption(node.test))
-        right = CFANode()
-        edge = CFAEdge(
+        left = self._newNode()
+        edge = self._newEdge(entrynode, left, Instruction.assumption(node.test))
+        right = self._newNode()
+        edge = self._newEdge(
             entrynode, right, Instruction.assumption(node.test, negated=True)
         )
         self.nodestack.append(left)
@@ -118,13 +242,13 @@ class CFACreator(ast.NodeVisitor):
         for statement in node.orelse:
             self.visit(statement)
         rightexit = self.nodestack.pop()
-        mergedExit = CFANode.merge(leftexit, rightexit)
+        mergedExit = self._merge(leftexit, rightexit)
         self.nodestack.append(mergedExit)
 
     def visit_Expr(self, node):
         entrynode = self.nodestack.pop()
-        exitNode = CFANode()
-        edge = CFAEdge(entrynode, exitNode, Instruction.statement(node.value))
+        exitNode = self._newNode()
+        edge = self._newEdge(entrynode, exitNode, Instruction.statement(node.value))
         self.nodestack.append(exitNode)
 
     def visit_AugAssign(self, node):
@@ -132,12 +256,11 @@ class CFACreator(ast.NodeVisitor):
 
     def visit_Assign(self, node):
         entryNode = self.nodestack.pop()
-        exitNode = CFANode()
-        edge = CFAEdge(entryNode, exitNode, Instruction.statement(node))
+        exitNode = self._newNode()
+        edge = self._newEdge(entryNode, exitNode, Instruction.statement(node))
         self.nodestack.append(exitNode)
 
 
-
 program = """
 def mybody(x,y):
   while True:
@@ -151,11 +274,11 @@ def mybody(x,y):
       x-=100
 """
 
-tree = ast.parse(program)
-tree2 = ast.parse('x = 10 + y * 5')
+if __name__ == '__main__':
+    tree = ast.parse(program)
 
-cfaCreator = CFACreator()
-cfaCreator.visit(tree)
-cfaRoot = cfaCreator.root
+    cfaCreator = CFACreator()
+    cfaCreator.visit(tree)
+    cfaRoot = cfaCreator.root
 
-print(cfaRoot.leavingEdges[1].instruction.expression)
+    print(cfaRoot.leavingEdges[1].instruction.expression)
@@ -0,0 +1,684 @@
+import os
+from collections import OrderedDict
+import numpy as np
+from pysmt.shortcuts import And, Equals, Int, Minus, Solver
+from pysmt.operators import (
+    AND, OR, NOT, IMPLIES, IFF, EQUALS, LE, LT, ITE, PLUS, MINUS, TIMES,
+    SYMBOL, INT_CONSTANT, BOOL_CONSTANT
+)
+from utils import get_var
+from settings import SETTINGS
+from transitions import DIVERGES, TransitionStore, get_keys
+from profiling import solver_call
+
+
+###
+# Compilation of pysmt formulas into python functions
+###
+class CompilationError(Exception):
+    """Raised if a formula can not be turned into a python evaluator."""
+    pass
+
+
+def _compile_expression(formula, symbols, vectorized):
+    # returns python source code that evaluates the formula for a state s
+    node_type = formula.node_type()
+    args = [_compile_expression(arg, symbols, vectorized) for arg in formula.args()]
+
+    if node_type == SYMBOL:
+        if formula not in symbols:
+            raise CompilationError(
+                "Symbol '%s' is not bound to a state variable." % formula.symbol_name())
+        if vectorized:
+            return 's[:, %d]' % symbols[formula]
+        return 's[%d]' % symbols[formula]
+    if node_type == INT_CONSTANT:
+        return '(%d)' % formula.constant_value()
+    if node_type == BOOL_CONSTANT:
+        return 'True' if formula.constant_value() else 'False'
+
+    if node_type == AND:
+        if len(args) == 0:
+            return 'True'
+        return '(%s)' % (' & ' if vectorized else ' and ').join(args)
+    if node_type == OR:
+        if len(args) == 0:
+            return 'False'
+        return '(%s)' % (' | ' if vectorized else ' or ').join(args)
+    if node_type == NOT:
+        if vectorized:
+            return 'np.logical_not(%s)' % args[0]
+        return '(not %s)' % args[0]
+    if node_type == IMPLIES:
+        if vectorized:
+            return '(np.logical_not(%s) | %s)' % (args[0], args[1])
+        return '((not %s) or %s)' % (args[0], args[1])
+    if node_type == ITE:
+        if vectorized:
+            return 'np.where(%s, %s, %s)' % (args[0], args[1], args[2])
+        return '(%s if %s else %s)' % (args[1], args[0], args[2])
+
+    if node_type in (EQUALS, IFF):
+        return '(%s == %s)' % (args[0], args[1])
+    if node_type == LE:
+        return '(%s <= %s)' % (args[0], args[1])
+    if node_type == LT:
+        return '(%s < %s)' % (args[0], args[1])
+    if node_type == PLUS:
+        return '(%s)' % ' + '.join(args)
+    if node_type == MINUS:
+        return '(%s - %s)' % (args[0], args[1])
+    if node_type == TIMES:
+        return '(%s)' % ' * '.join(args)
+
+    raise CompilationError("Unsupported operator in '%s'." % formula.serialize())
+
+
+def _stack(states, *columns):
+    # constant columns need to be repeated for every state
+    return np.column_stack([np.broadcast_to(column, (len(states),)) for column in columns])
+
+
+def _to_function(source):
+    return eval('lambda s: ' + source, {'np': np, '_stack': _stack})
+
+
+def compile_formula(formula, symbols, vectorized=False):
+    """Compiles a ground predicate or term over the symbols into a function
+    of a state. A state is a tuple of integers or, if vectorized, an (N, d)
+    array of states."""
+    return _to_function(_compile_expression(formula, symbols, vectorized))
+
+
+def _get_assignments(formula, symbols, targets, vectorized):
+    # turns a deterministic transition formula into one expression per target
+    if formula.is_and():
+        assignments = {}
+        for arg in formula.args():
+            for key, expression in _get_assignments(arg, symbols, targets, vectorized).items():
+                if key in assignments:
+                    raise CompilationError("Variable is assigned twice.")
+                assignments[key] = expression
+        return assignments
+
+    if formula.is_ite() and formula.arg(1).get_type().is_bool_type():
+        condition = _compile_expression(formula.arg(0), symbols, vectorized)
+        left = _get_assignments(formula.arg(1), symbols, targets, vectorized)
+        right = _get_assignments(formula.arg(2), symbols, targets, vectorized)
+        if left.keys() != right.keys():
+            raise CompilationError("Branches assign different variables.")
+        assignments = {}
+        for key in left.keys():
+            if vectorized:
+                assignments[key] = 'np.where(%s, %s, %s)' % (condition, left[key], right[key])
+            else:
+                assignments[key] = '(%s if %s else %s)' % (left[key], condition, right[key])
+        return assignments
+
+    if formula.is_equals():
+        for target, expression in [formula.args(), reversed(formula.args())]:
+            if target in targets and not any(
+                    variable in targets for variable in expression.get_free_variables()):
+                return {targets[target]: _compile_expression(expression, symbols, vectorized)}
+
+    raise CompilationError("'%s' is not a deterministic assignment." % formula.serialize())
+
+
+def compile_transition(formula, symbols, targets, vectorized=False):
+    """Compiles a transition formula into a function that maps a state to its
+    successor. Raises a CompilationError if the successor is not uniquely
+    determined by the formula."""
+    assignments = _get_assignments(formula, symbols, targets, vectorized)
+    if len(assignments) != len(targets):
+        raise CompilationError("Some variables are not assigned by the body.")
+    expressions = [assignments[i] for i in range(len(targets))]
+    if vectorized:
+        return _to_function('_stack(s, %s)' % ', '.join(expressions))
+    return _to_function('(%s,)' % ', '.join(expressions))
+
+
+def _is_linear(term):
+    # a sum of constant multiples of symbols, an ite picks one of two sums
+    node_type = term.node_type()
+    if node_type in (SYMBOL, INT_CONSTANT):
+        return True
+    if node_type in (PLUS, MINUS):
+        return all(_is_linear(arg) for arg in term.args())
+    if node_type == TIMES:
+        factors = [arg for arg in term.args() if len(arg.get_free_variables()) != 0]
+        return len(factors) <= 1 and all(_is_linear(arg) for arg in term.args())
+    if node_type == ITE:
+        return _is_linear(term.arg(1)) and _is_linear(term.arg(2))
+    return False
+
+
+def _get_halfspaces(formula, targets, halfspaces):
+    # adds a term u with u >= 0 for every side of every comparison in the
+    # formula that does not mention the targets; False if a term is not linear
+    node_type = formula.node_type()
+    if node_type in (LT, LE, EQUALS) and formula.arg(0).get_type().is_int_type():
+        left, right = formula.args()
+        if not (_is_linear(left) and _is_linear(right)):
+            return False
+        if not any(variable in targets for variable in formula.get_free_variables()):
+            if node_type == LT:
+                halfspaces.append(Minus(Minus(right, left), Int(1)))
+            elif node_type == LE:
+                halfspaces.append(Minus(right, left))
+            else:
+                halfspaces += [Minus(left, right), Minus(right, left)]
+    elif node_type not in (AND, OR, NOT, IMPLIES, IFF, ITE, PLUS, MINUS, TIMES,
+                           SYMBOL, INT_CONSTANT, BOOL_CONSTANT):
+        return False
+    return all(_get_halfspaces(arg, targets, halfspaces) for arg in formula.args())
+
+
+def compile_halfspaces(formulas, symbols, targets):
+    """Compiles the comparisons of the formulas into one function that maps
+    an (N, d) array of states to the (N, h) values of the halfspaces u >= 0
+    they consist of. Inside one side of every halfspace a body with linear
+    terms is an affine map. Returns None if there is no comparison or a term
+    is not linear."""
+    halfspaces = []
+    for formula in formulas:
+        if not _get_halfspaces(formula, targets, halfspaces):
+            return None
+    halfspaces = list(dict.fromkeys(halfspaces))
+    if len(halfspaces) == 0:
+        return None
+    expressions = [_compile_expression(halfspace, symbols, True) for halfspace in halfspaces]
+    return _to_function('_stack(s, %s)' % ', '.join(expressions))
+
+
+###
+# Rules of a trace
+# Shared by Program.run and Program.run_batch
+###
+def _is_exhausted(steps, budget):
+    # a trace whose cond still holds after the budget is cut off
+    return steps >= budget
+
+
+def _is_diverged(cycled, exhausted, lengths, budget):
+    # a trace diverges if it runs in a cycle, is cut off or ends too late
+    return cycled | exhausted | (lengths > budget)
+
+
+class _Visits:
+    """The first row and steps of every visited state. A trace that comes to
+    a state after as many or more steps than its first visit joins it, e.g.
+    a trace that comes back to one of its own states runs in a cycle."""
+
+    def __init__(self):
+        self.first = {}
+        self.size = 0
+
+    def visit(self, key, step, join=True):
+        """Returns the first row of the state if the trace joins it, else -1
+        and the state becomes a new row."""
+        seen = self.first.get(key)
+        if seen is not None and seen[1] <= step:
+            if join:
+                return seen[0]
+        else:
+            self.first[key] = (self.size, step)
+        self.size += 1
+        return -1
+
+
+class _Traces:
+    """The traces of Program.run_batch after the lockstep: the current state,
+    steps and store id they joined of every trace, the row of the batch it
+    joined and whether it was cut off, and the visited states with their
+    trace and steps, ordered trace by trace."""
+
+    def __init__(self, current, steps, joined, merged, exhausted, states, owners, row_steps):
+        self.current = current
+        self.steps = steps
+        self.joined = joined
+        self.merged = merged
+        self.exhausted = exhausted
+        self.states = states
+        self.owners = owners
+        self.row_steps = row_steps
+
+
+###
+# Compiled program
+###
+class Program:
+    """A program dict from programs.py compiled into python functions.
+
+    States are tuples of integers ordered like code['map']. The solver is only
+    used as a fallback for parts of the program that can not be compiled,
+    e.g. a nondeterministic body."""
+
+    def __init__(self, code):
+        self.code = code
+        self.variables = list(code['map'].keys())
+        self._solvers = {}
+        self._solvers_pid = None
+        self.plain_vars = [get_var(key) for key in self.variables]
+        self.pre_vars = [get_var(key, code['map'][key]['pre']) for key in self.variables]
+        self.body_vars = [get_var(key, code['map'][key]['body']) for key in self.variables]
+
+        # substitution templates, e.g. ('body', True) maps x@1 to x@2 like
+        # get_substitution(code, 'body', True)
+        self.substitutions = {
+            ('pre', False): dict(zip(self.plain_vars, self.pre_vars)),
+            ('pre', True): dict(zip(self.pre_vars, self.pre_vars)),
+            ('body', False): dict(zip(self.plain_vars, self.body_vars)),
+            ('body', True): dict(zip(self.pre_vars, self.body_vars)),
+            ('plain', True): dict(zip(self.pre_vars, self.plain_vars))
+        }
+        # cond and paths over the plain variables, cond over the body variables
+        self.plain_cond = code['cond'].substitute(self.substitutions[('plain', True)])
+        self.plain_paths = [path.substitute(self.substitutions[('plain', True)]) for path in code['paths']]
+        self.body_cond = code['cond'].substitute(self.substitutions[('body', True)])
+
+        # pre, cond and paths are evaluated on the pre variables, post on the
+        # body variables; plain names like x refer to the state as well
+        self.pre_symbols = pre_symbols = {}
+        self.post_symbols = post_symbols = {}
+        for i, key in enumerate(self.variables):
+            pre_symbols[self.plain_vars[i]] = i
+            pre_symbols[self.pre_vars[i]] = i
+            post_symbols[self.plain_vars[i]] = i
+            post_symbols[self.body_vars[i]] = i
+        self._predicates = {}
+
+        self.pre, self.pre_batch = self._compile_predicate(
+            code['pre'], pre_symbols, self.pre_vars)
+        self.cond, self.cond_batch = self._compile_predicate(
+            code['cond'], pre_symbols, self.pre_vars)
+        self.post, self.post_batch = self._compile_predicate(
+            code['post'], post_symbols, self.body_vars)
+        self.paths = [
+            self._compile_predicate(path, pre_symbols, self.pre_vars)[0]
+            for path in code['paths']
+        ]
+        targets = {var: i for i, var in enumerate(self.body_vars)}
+        try:
+            self.step = compile_transition(code['body'], pre_symbols, targets)
+            self.step_batch = compile_transition(code['body'], pre_symbols, targets, True)
+            self.deterministic = True
+        except CompilationError:
+            self.step = self._solve_step
+            self.step_batch = self._vectorize(self._solve_step, len(self.variables))
+            self.deterministic = False
+
+        # the regions in which the body is one affine map, see _accelerate
+        self.halfspaces = None
+        if self.deterministic:
+            self.halfspaces = compile_halfspaces(
+                [code['cond'], code['body']] + code['paths'], pre_symbols, targets)
+
+    def get_state(self, variables):
+        return tuple(int(variables[key]) for key in self.variables)
+
+    def get_variables(self, state):
+        return dict(zip(self.variables, state))
+
+    def _get_numbers(self, state, variables):
+        return And([Equals(var, Int(int(value))) for var, value in zip(variables, state)])
+
+    def _vectorize(self, function, columns=None):
+        # applies a function on single states to an (N, d) array of states
+        def batch_function(states):
+            values = [function(tuple(int(value) for value in state)) for state in states]
+            if columns is None:
+                return np.array(values, bool).reshape(len(states))
+            return np.array(values, int).reshape(len(states), columns)
+        return batch_function
+
+    def _compile_predicate(self, formula, symbols, variables):
+        # returns a function on single states and one on arrays of states
+        try:
+            function = compile_formula(formula, symbols)
+            batch_function = compile_formula(formula, symbols, True)
+        except CompilationError:
+            # formulas with free variables are existentially quantified
+            def function(state):
+                solver = self._get_solver(formula)
+                solver.push()
+                try:
+                    numbers = self._get_numbers(state, variables)
+                    solver.add_assertion(numbers)
+                    return solver_call('predicate', numbers, solver.solve)
+                finally:
+                    solver.pop()
+            return function, self._vectorize(function)
+        return (
+            lambda state: bool(function(state)),
+            lambda states: np.broadcast_to(batch_function(states), (len(states),))
+        )
+
+    def _get_solver(self, formula):
+        # one solver with the formula asserted per process, a forked worker
+        # must not share the solvers of its parent
+        if self._solvers_pid != os.getpid():
+            self._solvers = {}
+            self._solvers_pid = os.getpid()
+        if formula not in self._solvers:
+            self._solvers[formula] = Solver()
+            self._solvers[formula].add_assertion(formula)
+        return self._solvers[formula]
+
+    def get_predicate(self, formula):
+        """Returns a function that evaluates a predicate over plain or pre
+        variables, e.g. a region of find_disjunctive_invariant, on an (N, d)
+        array of states. Every formula is only compiled once."""
+        if formula not in self._predicates:
+            self._predicates[formula] = self._compile_predicate(
+                formula, self.pre_symbols, self.plain_vars)[1]
+        return self._predicates[formula]
+
+    def _solve_step(self, state):
+        solver = self._get_solver(self.code['body'])
+        solver.push()
+        try:
+            numbers = self._get_numbers(state, self.pre_vars)
+            solver.add_assertion(numbers)
+            if not solver_call('step', numbers, solver.solve):
+                raise Exception("The body has no successor for %s." % str(state))
+            model = solver.get_model()
+            return tuple(int(model.get_py_value(var)) for var in self.body_vars)
+        finally:
+            solver.pop()
+
+    def run(self, state, store=None):
+        """Follows the loop from the state for at most SETTINGS['EVALUATE']
+        ['STEPS'] steps. Returns all visited states and whether the trace was
+        cut off, because it ran in a cycle or out of steps."""
+        if store is not None:
+            _, states, _, diverged = self.run_batch(np.array([state], int), store)
+            return [tuple(int(value) for value in state) for state in states], bool(diverged[0])
+        budget = SETTINGS['EVALUATE']['STEPS']
+        states = [state]
+        visit = _Visits().visit
+        visit(state, 0)
+        steps = 0
+        cycled = exhausted = False
+        while self.cond(state):
+            exhausted = _is_exhausted(steps, budget)
+            if exhausted:
+                break
+            state = self.step(state)
+            cycled = visit(state, steps + 1) >= 0
+            if cycled:
+                break
+            states.append(state)
+            steps += 1
+        return states, bool(_is_diverged(cycled, exhausted, steps, budget))
+
+    def _accelerate(self, states, values, successors, regions, deltas, stepped, budgets):
+        """Jumps ahead on the traces that move by the same delta d twice in a
+        row without leaving a region of the halfspaces. The body is an affine
+        map A s + b in the region and A d = d, so the trace stays on the line
+        s + j * d until the first j at which a halfspace changes its side.
+
+        Takes the current states with the values of their halfspaces, their
+        successors, the region and delta of the step before every state and
+        whether there was one. Returns the states after the jump with the
+        values of their halfspaces, the steps taken, the region and delta of
+        the current states and up to SETTINGS['EVALUATE']['SAMPLES'] states of
+        every jump in between with the row they belong to."""
+        rates = self.halfspaces(successors) - values
+        region = values >= 0
+        delta = successors - states
+        steady = stepped & np.all(delta == deltas, axis=1) & np.all(region == regions, axis=1)
+        if not steady.any():
+            ones = np.ones(len(states), int)
+            return successors, values + rates, ones, region, delta, states[:0], ones[:0], ones[:0]
+
+        # first j > 0 at which u + j * r >= 0 changes
+        flips = np.full(values.shape, np.iinfo(int).max)
+        leaving = region & (rates < 0)
+        flips[leaving] = values[leaving] // -rates[leaving] + 1
+        entering = ~region & (rates > 0)
+        flips[entering] = (rates[entering] - values[entering] - 1) // rates[entering]
+        jumps = np.where(steady, np.minimum(np.min(flips, axis=1), budgets), 1)
+
+        # s + j * d for j spread over 1 .. jumps - 1, the last one is always kept
+        count = SETTINGS['EVALUATE']['SAMPLES']
+        rows = np.flatnonzero(jumps > 1)
+        offsets = 1 + np.arange(count) * (jumps[rows, None] - 2) // max(count - 1, 1)
+        offsets[:, -1] = jumps[rows] - 1
+        keep = np.append(np.ones((len(rows), 1), bool), offsets[:, 1:] > offsets[:, :-1], axis=1)
+        samples = states[rows, None] + offsets[:, :, None] * delta[rows, None]
+        return (
+            states + jumps[:, None] * delta, values + jumps[:, None] * rates, jumps, region, delta,
+            samples[keep], np.repeat(rows, keep.sum(axis=1)), offsets[keep]
+        )
+
+
+    def run_batch(self, states, store=None):
+        """Follows the loop from all rows of an (N, d) array in lockstep. A
+        trace drops out once its cond is false. Returns the final states, all
+        visited states together with the row of the state they started from,
+        ordered trace by trace, and which traces diverged.
+
+        A trace follows the rules of run; it also joins a trace of the batch
+        that visited its state after as many or fewer steps, and with a
+        transition store it drops out at the first state the store knows. The
+        rest of such a trace is read from the other trace or the store.
+
+        With SETTINGS['EVALUATE']['ACCELERATE'] a trace that stays in one
+        region of the body jumps to the first state after it, see _accelerate."""
+        if store is None:
+            store = TransitionStore(len(self.variables))
+        traces = self._step_lockstep(np.array(states, int).reshape(-1, len(self.variables)), store)
+        final_states, lengths, cycled = self._label_ends(traces, store)
+        diverged = _is_diverged(cycled, traces.exhausted, lengths, SETTINGS['EVALUATE']['STEPS'])
+        self._memoize(traces, store, final_states, lengths, cycled)
+        states, owners = self._read_rest(traces, store)
+        final_states[diverged] = traces.current[diverged]
+        return final_states, states, owners, diverged
+
+    def _step_lockstep(self, current, store):
+        # steps all traces until they end, are cut off or join another trace
+        # or the store
+        budget = SETTINGS['EVALUATE']['STEPS']
+        joined = store.find(current)
+        steps = np.zeros(len(current), int)
+        visits = _Visits()
+        visited = []
+        owners = []
+        row_steps = []
+        merged = np.full(len(current), -1)
+
+        def visit(active, new_states, new_steps, join=True):
+            # returns the traces that did not join another one
+            rows = np.array([
+                visits.visit(key, step, join) for key, step in zip(get_keys(new_states).tolist(), new_steps.tolist())
+            ], int)
+            merged[active[rows >= 0]] = rows[rows >= 0]
+            keep = rows < 0
+            visited.append(new_states[keep])
+            owners.append(active[keep])
+            row_steps.append(new_steps[keep])
+            return active[keep]
+
+        active = np.flatnonzero(joined < 0)
+        active = visit(active, current[active], steps[active])
+        exhausted = np.zeros(len(current), bool)
+        accelerate = SETTINGS['EVALUATE']['ACCELERATE'] and self.halfspaces is not None
+        if accelerate:
+            # the values of the halfspaces in the current state, the region
+            # and the step that led to it
+            values = self.halfspaces(current)
+            regions = values >= 0
+            deltas = np.zeros_like(current)
+            stepped = np.zeros(len(current), bool)
+        while len(active) != 0:
+            active = active[self.cond_batch(current[active])]
+            out_of_steps = _is_exhausted(steps[active], budget)
+            exhausted[active[out_of_steps]] = True
+            active = active[~out_of_steps]
+            if len(active) == 0:
+                break
+            successors = self.step_batch(current[active])
+            if accelerate:
+                successors, values[active], jumps, region, delta, samples, rows, offsets = self._accelerate(
+                    current[active], values[active], successors, regions[active], deltas[active],
+                    stepped[active], budget - steps[active])
+                regions[active] = region
+                deltas[active] = delta
+                stepped[active] = True
+                visit(active[rows], samples, steps[active[rows]] + offsets, False)
+                steps[active] += jumps
+            else:
+                steps[active] += 1
+            current[active] = successors
+            joined[active] = store.find(current[active])
+            active = active[joined[active] < 0]
+            active = visit(active, current[active], steps[active])
+
+        # the visited states trace by trace, merged points to the new rows
+        order = np.argsort(np.concatenate(owners), kind='stable')
+        positions = np.empty_like(order)
+        positions[order] = np.arange(len(order))
+        merged[merged >= 0] = positions[merged[merged >= 0]]
+        return _Traces(
+            current, steps, joined, merged, exhausted,
+            np.concatenate(visited)[order], np.concatenate(owners)[order], np.concatenate(row_steps)[order])
+
+    def _label_ends(self, traces, store):
+        # the final state, the steps and whether it runs in a cycle of every
+        # trace; the steps of a trace that runs in a cycle are those until it
+        # comes back to a state it visited, those of a trace that ran out of
+        # them before it ended are unknown (-1). A trace that joined a trace
+        # that was cut off is marked as cut off as well.
+        steps, joined, merged, exhausted = traces.steps, traces.joined, traces.merged, traces.exhausted
+        owners = traces.owners
+        lengths = np.full(len(steps), -1)
+        final_states = traces.current.copy()
+        ended = ~exhausted & (joined < 0) & (merged < 0)
+        lengths[ended] = steps[ended]
+        cycled = np.zeros(len(steps), bool)
+        known = joined >= 0
+        cycled[known] = store.finals[joined[known]] == DIVERGES
+        lengths[known] = steps[known] + store.lengths[joined[known]]
+        known &= ~cycled
+        final_states[known] = store.states[store.finals[joined[known]]]
+        # a trace that joined the batch ends like the trace it joined
+        merging = np.flatnonzero(merged >= 0)
+        while len(merging) != 0:
+            targets = owners[merged[merging]]
+            done = (lengths[targets] >= 0) | exhausted[targets]
+            if not np.any(done):
+                # the traces left join each other and run in a cycle, every
+                # cycle is closed by the first trace on it
+                cycle = merging
+                for _ in range(len(merging)):
+                    cycle = owners[merged[cycle]]
+                closing = cycle
+                for _ in range(len(merging)):
+                    cycle = owners[merged[cycle]]
+                    closing = np.minimum(closing, cycle)
+                closing = np.unique(closing)
+                lengths[closing] = steps[closing]
+                cycled[closing] = True
+                merging = merging[~np.isin(merging, closing)]
+                continue
+            rows, targets = merging[done], targets[done]
+            cycled[rows] = cycled[targets]
+            exhausted[rows] = exhausted[targets]
+            rows, targets = rows[lengths[targets] >= 0], targets[lengths[targets] >= 0]
+            lengths[rows] = steps[rows] + lengths[targets] - traces.row_steps[merged[rows]]
+            final_states[rows] = final_states[targets]
+            merging = merging[~done]
+        return final_states, lengths, cycled
+
+    def _memoize(self, traces, store, final_states, lengths, cycled):
+        # every state of a trace that ended or runs in a cycle is stored once:
+        # a row gets the id of the state if the store knows it, e.g. a sample
+        # of a jump, and else the id of the first row of the state
+        new_states, owners, row_steps = traces.states, traces.owners, traces.row_steps
+        joined, merged = traces.joined, traces.merged
+        stored = np.flatnonzero(~traces.exhausted[owners])
+        _, first, inverse = np.unique(get_keys(new_states[stored]), return_index=True, return_inverse=True)
+        unique_ids = store.find(new_states[stored[first]])
+        kept = np.sort(first[unique_ids < 0])
+        unique_ids[unique_ids < 0] = len(store) + np.searchsorted(kept, first[unique_ids < 0])
+        ids = np.full(len(new_states), -1)
+        ids[stored] = unique_ids[inverse]
+        kept = stored[kept]
+
+        # s ⇒ s' for the new states, the last new state of a trace leads to
+        # the state it joined or ends the trace
+        last = np.append(owners[1:] != owners[:-1], True)[:len(owners)]
+        successors = np.append(ids[1:], -1)[:len(ids)]
+        successors[last] = -1
+        to_store = last & (joined[owners] >= 0)
+        successors[to_store] = joined[owners[to_store]]
+        to_batch = last & (merged[owners] >= 0)
+        successors[to_batch] = ids[merged[owners[to_batch]]]
+        start = len(store)
+        store.add(
+            new_states[kept], successors[kept], np.full(len(kept), DIVERGES),
+            lengths[owners[kept]] - row_steps[kept]
+        )
+        finals = store.find(final_states[owners[kept]])
+        store.finals[start:] = np.where(cycled[owners[kept]], DIVERGES, finals)
+
+    def _read_rest(self, traces, store):
+        # the visited states of every trace, the rest of the traces that
+        # joined another trace or the store included, each once and within
+        # the budget
+        budget = SETTINGS['EVALUATE']['STEPS']
+        new_states, owners, row_steps = traces.states, traces.owners, traces.row_steps
+        steps, joined, merged = traces.steps, traces.joined, traces.merged
+
+        # the rest of the traces that joined another trace of the batch, with
+        # the steps at which they get there
+        tails = [(new_states, owners, row_steps)]
+        tail_owners = np.flatnonzero(merged >= 0)
+        tail_rows = merged[tail_owners]
+        offsets = steps[tail_owners] - row_steps[tail_rows]
+        ends = np.searchsorted(owners, np.arange(len(steps)), 'right')
+        known = joined >= 0
+        followed = [(np.flatnonzero(known), joined[known], steps[known])]
+        while len(tail_owners) != 0:
+            targets = owners[tail_rows]
+            counts = ends[targets] - tail_rows
+            rows = np.repeat(tail_rows - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            tails.append((new_states[rows], np.repeat(tail_owners, counts), row_steps[rows] + np.repeat(offsets, counts)))
+            offsets = offsets + steps[targets]
+            to_store = joined[targets] >= 0
+            followed.append((tail_owners[to_store], joined[targets[to_store]], offsets[to_store]))
+            on = (merged[targets] >= 0) & (offsets <= budget)
+            tail_owners, tail_rows = tail_owners[on], merged[targets[on]]
+            offsets = offsets[on] - row_steps[tail_rows]
+
+        # the rest of the traces that joined the store
+        tail_owners, starts, offsets = (np.concatenate(parts) for parts in zip(*followed))
+        walked, walked_starts, walked_steps = store.follow(starts, offsets, budget)
+        tails.append((store.states[walked], tail_owners[walked_starts], walked_steps))
+
+        # a trace that was cut off only keeps the states within the budget
+        states, owners, row_steps = (np.concatenate(parts) for parts in zip(*tails))
+        inside = row_steps <= budget
+        states, owners = states[inside], owners[inside]
+        first = np.sort(np.unique(get_keys(np.column_stack([owners, states])), return_index=True)[1])
+        states, owners = states[first], owners[first]
+        order = np.argsort(owners, kind='stable')
+        return states[order], owners[order]
+
+
+_programs = OrderedDict()
+
+
+def compile_program(code):
+    """Returns the compiled program of a program dict, compiled only once.
+    The SETTINGS['MEMO_SIZE']['PROGRAMS'] most recently used programs are
+    kept; a kept program holds its dict, so the id of the dict is not
+    reused while it is kept."""
+    program = _programs.get(id(code))
+    if program is None:
+        program = Program(code)
+        _programs[id(code)] = program
+    _programs.move_to_end(id(code))
+    while len(_programs) > SETTINGS['MEMO_SIZE']['PROGRAMS']:
+        _programs.popitem(last=False)
+    return program
@@ -0,0 +1,286 @@
+import ast
+import functools
+import hashlib
+import json
+import os
+import re
+from pysmt.shortcuts import And, Equals, Ite, Symbol
+from pysmt.typing import INT
+from pysmt.parsing import parse
+from settings import SETTINGS
+from utils import get_var, write_atomic
+from cfa import CFA, CFACreator, Instruction, InstructionType
+from toformulavisitor import FrontendError, ToFormulaVisitor
+
+
+# increase it when the encoding changes
+VERSION = 4
+
+
+###
+# Source
+###
+def _split(source):
+    # the assertions before the loop, the loop and the assertions after it
+    statements = ast.parse(source).body
+    if len(statements) == 1 and isinstance(statements[0], ast.FunctionDef):
+        statements = [
+            statement for statement in statements[0].body
+            if not isinstance(statement, ast.Return)
+        ]
+    loops = [i for i, statement in enumerate(statements) if isinstance(statement, ast.While)]
+    if len(loops) != 1:
+        raise FrontendError("The program needs exactly one while loop.")
+    before, loop, after = statements[:loops[0]], statements[loops[0]], statements[loops[0] + 1:]
+    for statement in before + after:
+        if not isinstance(statement, ast.Assert):
+            raise FrontendError(
+                "Only assertions can stand before and after the loop, found %s." % type(statement).__name__)
+    for node in ast.walk(ast.Module(body=loop.body, type_ignores=[])):
+        if isinstance(node, (ast.While, ast.For, ast.Break, ast.Continue, ast.Return)):
+            raise FrontendError("The loop body can not contain %s." % type(node).__name__)
+    return [statement.test for statement in before], loop, [statement.test for statement in after]
+
+
+def _get_names(loop, tests):
+    names = set()
+    for tree in [loop] + tests:
+        names.update(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+    return sorted(names)
+
+
+###
+# SSA
+###
+def _to_formula(expression, ssamap):
+    visitor = ToFormulaVisitor(ssamap)
+    visitor.visit(expression)
+    return visitor.rstack.pop()
+
+
+def _to_assignment(cfa, edge, ssamap):
+    # returns the assigned symbol, its value and the new ssa map
+    expression = cfa.instruction(edge).expression
+    if not isinstance(expression, (ast.Assign, ast.AugAssign)):
+        raise FrontendError("Unsupported statement %s." % cfa.label(edge))
+    visitor = ToFormulaVisitor(ssamap)
+    visitor.visit(expression)
+    if len(visitor.lstack) != 1 or len(visitor.rstack) != 1:
+        raise FrontendError("Only assignments to one variable are supported, found %s." % cfa.label(edge))
+    return visitor.lstack[0], visitor.rstack[0], visitor.newssamap
+
+
+def _get_next(cfa, node, stop, joins):
+    # the next node that every path from node passes
+    edges = cfa.leavingEdges(node)
+    if len(edges) == 2:
+        return _get_join(cfa, node, stop, joins)
+    if len(edges) != 1:
+        raise FrontendError("The CFA ends in (%d) inside the loop." % node)
+    return cfa.successor(edges[0])
+
+
+def _get_join(cfa, node, stop, joins):
+    # the node where the two branches of the if in node meet again; both
+    # branches are walked in lockstep and inner ifs are skipped, so the walk
+    # only visits the if itself
+    if node not in joins:
+        current = [cfa.successor(edge) for edge in cfa.leavingEdges(node)]
+        seen = [{current[0]}, {current[1]}]
+        join = current[0] if current[0] == current[1] else None
+        while join is None:
+            for side in [0, 1]:
+                if current[side] != stop:
+                    current[side] = _get_next(cfa, current[side], stop, joins)
+                    seen[side].add(current[side])
+                if current[side] in seen[1 - side]:
+                    join = current[side]
+                    break
+        joins[node] = join
+    return joins[node]
+
+
+def _substitute(formula, definitions):
+    # substitutes only the symbols of the formula, pysmt checks every key
+    symbols = formula.get_free_variables()
+    return formula.substitute({symbol: definitions[symbol] for symbol in symbols if symbol in definitions})
+
+
+def _encode(cfa, node, stop, ssamap, definitions, paths, joins):
+    # the loop free part from node to stop in ssa form, the ssa map at stop
+    # and every assigned symbol as a term over the symbols at node; the if
+    # conditions over the symbols at node are added to paths
+    formulas = []
+    definitions = dict(definitions)
+    while node != stop:
+        edges = cfa.leavingEdges(node)
+        if len(edges) == 1 and cfa.instruction(edges[0]).kind == InstructionType.STATEMENT:
+            symbol, value, ssamap = _to_assignment(cfa, edges[0], ssamap)
+            formulas.append(Equals(symbol, value))
+            definitions[symbol] = _substitute(value, definitions)
+            node = cfa.successor(edges[0])
+        elif len(edges) == 2:
+            then_edge, else_edge = sorted(edges, key=lambda edge: cfa.instruction(edge).negated)
+            test = _to_formula(cfa.instruction(then_edge).expression, ssamap)
+            path = _substitute(test, definitions)
+            if path not in paths:
+                paths.append(path)
+            then_node, else_node = cfa.successor(then_edge), cfa.successor(else_edge)
+            join = _get_join(cfa, node, stop, joins)
+            then_formula, then_map, then_definitions = _encode(
+                cfa, then_node, join, ssamap, definitions, paths, joins)
+            else_formula, else_map, else_definitions = _encode(
+                cfa, else_node, join, ssamap, definitions, paths, joins)
+
+            # a branch that assigned a variable less often catches up
+            then_formulas = [then_formula]
+            else_formulas = [else_formula]
+            merged = {}
+            for name in ssamap:
+                merged[name] = index = max(then_map[name], else_map[name])
+                symbol = get_var(name, index)
+                then_symbol = get_var(name, then_map[name])
+                else_symbol = get_var(name, else_map[name])
+                if then_map[name] != index:
+                    then_formulas.append(Equals(symbol, then_symbol))
+                if else_map[name] != index:
+                    else_formulas.append(Equals(symbol, else_symbol))
+                if index != ssamap[name]:
+                    then_value = then_definitions.get(then_symbol, then_symbol)
+                    else_value = else_definitions.get(else_symbol, else_symbol)
+                    definitions[symbol] = then_value if then_value == else_value else Ite(path, then_value, else_value)
+            formulas.append(Ite(test, And(then_formulas), And(else_formulas)))
+            ssamap = merged
+            node = join
+        else:
+            raise FrontendError("Unsupported CFA node (%d)." % node)
+    return And(formulas), ssamap, definitions
+
+
+###
+# Large blocks
+###
+def _summarize(cfa, head, ssamap, paths):
+    # the loop body as one block edge that assigns every variable once, a
+    # term over the variables at the head
+    test, negated_test = sorted(cfa.leavingEdges(head), key=lambda edge: cfa.instruction(edge).negated)
+    _, body_map, definitions = _encode(cfa, cfa.successor(test), head, ssamap, {}, paths, {})
+    block = And([
+        Equals(get_var(name, ssamap[name] + 1), definitions.get(symbol, symbol))
+        for name, symbol in [(name, get_var(name, body_map[name])) for name in sorted(ssamap)]
+    ])
+
+    reduced = CFA()
+    reduced_head, inside, outside = reduced.addNode(), reduced.addNode(), reduced.addNode()
+    reduced.addEdge(reduced_head, inside, cfa.instruction(test))
+    reduced.addEdge(reduced_head, outside, cfa.instruction(negated_test))
+    reduced.addEdge(inside, reduced_head, Instruction.block(block))
+    return reduced, reduced_head
+
+
+def _compile(source):
+    pre_tests, loop, post_tests = _split(source)
+    names = _get_names(loop, pre_tests + post_tests)
+    ssamap = {name: 1 for name in names}
+
+    # the loop head has an edge into the body and one out of the loop
+    creator = CFACreator(compact=True)
+    creator.visit(loop)
+    cfa, head = creator.cfa, creator.root
+    paths = []
+    if SETTINGS['FRONTEND']['LARGE_BLOCKS']:
+        cfa, head = _summarize(cfa, head, ssamap, paths)
+    inside = [edge for edge in cfa.leavingEdges(head) if not cfa.instruction(edge).negated][0]
+    edges = cfa.leavingEdges(cfa.successor(inside))
+
+    copies = []
+    if len(edges) == 1 and cfa.instruction(edges[0]).kind == InstructionType.BLOCK:
+        body = cfa.instruction(edges[0]).expression
+        body_map = {name: ssamap[name] + 1 for name in names}
+    else:
+        body, body_map, _ = _encode(cfa, cfa.successor(inside), head, ssamap, {}, paths, {})
+
+        # variables the body does not assign keep their value
+        for name in names:
+            if body_map[name] == ssamap[name]:
+                body_map[name] = ssamap[name] + 1
+                copies.append(Equals(get_var(name, body_map[name]), get_var(name, ssamap[name])))
+
+    return {
+        'pre': And([_to_formula(test, ssamap) for test in pre_tests]),
+        'cond': _to_formula(loop.test, ssamap),
+        'body': And([body] + copies),
+        'post': And([_to_formula(test, body_map) for test in post_tests]),
+        'paths': paths,
+        'map': {name: {'pre': ssamap[name], 'body': body_map[name]} for name in names}
+    }
+
+
+###
+# Cache
+# Compiled programs as json in SETTINGS['FRONTEND']['CACHE'] if it is set
+###
+
+
+def _get_path(source):
+    key = hashlib.sha256(
+        ('%d\n%s\n%s' % (VERSION, SETTINGS['FRONTEND']['LARGE_BLOCKS'], source)).encode()).hexdigest()
+    return os.path.join(SETTINGS['FRONTEND']['CACHE'], key + '.json')
+
+
+def serialize(formula):
+    # the parser only reads ssa names like x@1 in quotes
+    return re.sub(r"([A-Za-z_][A-Za-z0-9_]*@[0-9]+)", r"'\1'", formula.serialize())
+
+
+def _to_data(code):
+    data = {key: serialize(code[key]) for key in ['pre', 'cond', 'body', 'post']}
+    data['paths'] = [serialize(path) for path in code['paths']]
+    data['map'] = code['map']
+    data['symbols'] = sorted(set(
+        symbol.symbol_name()
+        for formula in [code[key] for key in ['pre', 'cond', 'body', 'post']] + code['paths']
+        for symbol in formula.get_free_variables()
+    ))
+    return data
+
+
+def deserialize(text, names):
+    # the parser only knows declared symbols
+    for name in names:
+        Symbol(name, INT)
+    return parse(text)
+
+
+def _from_data(data):
+    code = {key: deserialize(data[key], data['symbols']) for key in ['pre', 'cond', 'body', 'post']}
+    code['paths'] = [deserialize(path, data['symbols']) for path in data['paths']]
+    code['map'] = data['map']
+    return code
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def compile_source(source):
+    # the program dict of a loop with assertions before and after it, e.g.
+    # the code_1 string of tree.py
+    return _compile_source(source, SETTINGS['FRONTEND']['LARGE_BLOCKS'])
+
+
+@functools.lru_cache(maxsize=SETTINGS['MEMO_SIZE']['PROGRAMS'])
+def _compile_source(source, large_blocks):
+    # the memo is keyed by the settings that change the program, like the
+    # cache on disk
+    path = None if SETTINGS['FRONTEND']['CACHE'] is None else _get_path(source)
+    data = None if path is None else _load(path)
+    if data is None:
+        data = _to_data(_compile(source))
+        if path is not None:
+            write_atomic(path, lambda file: json.dump(data, file), 'w')
+    # a compiled program is read back like a stored one
+    return _from_data(data)
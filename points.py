@@ -0,0 +1,105 @@
+import numpy as np
+
+
+# REQUIRED are the states every invariant has to contain, see find_violations
+LABELS = ['CE', 'DIVERGES', 'NEGATIVE', 'NP', 'POSITIVE', 'REQUIRED', 'UNKNOWN']
+
+
+###
+# Point store
+###
+class PointStore:
+    """Integer points per label, e.g. single_points['POSITIVE'].
+
+    Every label is a growing array with amortized O(1) appends; a point is
+    only stored once per label. Rows are never overwritten, so the array of
+    a label is a cheap snapshot that stays valid while more points are added.
+    """
+
+    def __init__(self, dimension=2, labels=LABELS, capacity=64):
+        self.dimension = dimension
+        self.capacity = capacity
+        self._points = {}
+        self._counts = {}
+        self._keys = {}
+        self._signatures = {}
+        for label in labels:
+            self.clear(label)
+
+    def __getitem__(self, label):
+        view = self._points[label][:self._counts[label]]
+        view.flags.writeable = False
+        return view
+
+    def __contains__(self, label):
+        return label in self._points
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+    def labels(self):
+        return list(self._points.keys())
+
+    def count(self, label):
+        return self._counts[label]
+
+    def clear(self, label):
+        # a new buffer keeps earlier snapshots of the label intact
+        self._points[label] = np.empty((self.capacity, self.dimension), int)
+        self._counts[label] = 0
+        self._keys[label] = set()
+        self._signatures[label] = np.empty(0, int)
+
+    def add(self, label, points):
+        """Adds the points that are not yet stored under the label and
+        returns how many were new."""
+        points = np.asarray(points, dtype=int).reshape(-1, self.dimension)
+        if len(points) == 0:
+            return 0
+        data = np.ascontiguousarray(points).tobytes()
+        size = len(data) // len(points)
+        keys = self._keys[label]
+        new = []
+        for i in range(len(points)):
+            key = data[i * size:(i + 1) * size]
+            if key not in keys:
+                keys.add(key)
+                new.append(i)
+        if len(new) == 0:
+            return 0
+        points = points[new]
+
+        # double the buffer if it is full
+        count = self._counts[label]
+        buffer = self._points[label]
+        if count + len(points) > len(buffer):
+            capacity = max(2 * len(buffer), count + len(points))
+            grown = np.empty((capacity, self.dimension), int)
+            grown[:count] = buffer[:count]
+            self._points[label] = buffer = grown
+        buffer[count:count + len(points)] = points
+        self._counts[label] = count + len(points)
+        return len(points)
+
+    def get_signatures(self, label, signatures):
+        """Returns the path signature of every point of the label.
+        signatures(points) is only called for the points added since the last
+        call."""
+        done = len(self._signatures[label])
+        if done < self._counts[label]:
+            self._signatures[label] = np.append(
+                self._signatures[label], signatures(self._points[label][done:self._counts[label]]))
+        return self._signatures[label]
+
+    def known(self, points, labels=None):
+        """Tells for every point whether it is stored under one of the
+        labels."""
+        if labels is None:
+            labels = self.labels()
+        points = np.ascontiguousarray(points, dtype=int).reshape(-1, self.dimension)
+        data = points.tobytes()
+        size = points.itemsize * self.dimension
+        return np.array([
+            any(data[i * size:(i + 1) * size] in self._keys[label] for label in labels)
+            for i in range(len(points))
+        ], bool)
@@ -0,0 +1,183 @@
+import json
+import time
+from settings import SETTINGS
+
+
+###
+# Counters
+# Cheap global counters of the work done by verify, e.g. for benchmarks
+###
+COUNTERS = {}
+
+
+def count(name, amount=1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + amount
+
+
+def record(name, value):
+    COUNTERS[name] = value
+
+
+def reset():
+    COUNTERS.clear()
+    EVENTS.clear()
+    del STACK[:]
+
+
+def collect():
+    """Returns and clears the counters and events of a worker process, to be
+    sent with its results and merged by the parent."""
+    collected = (dict(COUNTERS), list(EVENTS))
+    COUNTERS.clear()
+    EVENTS.clear()
+    return collected
+
+
+def merge(collected):
+    """Adds the collected counters and events of a worker process; its events
+    belong to the current phase and round of this process."""
+    counters, events = collected
+    for name, amount in counters.items():
+        count(name, amount)
+    for event in events:
+        event['stack'] = ';'.join(STACK + [event['stack']])
+        event['round'] = COUNTERS.get('rounds', 0)
+        EVENTS.append(event)
+
+
+###
+# Trace
+# With SETTINGS['PROFILE']['ENABLED'] every phase, solver call and fit is
+# recorded as an event; otherwise only the counters are updated
+###
+EVENTS = []
+STACK = []
+
+
+def is_enabled():
+    return SETTINGS['PROFILE']['ENABLED']
+
+
+class _NoPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        STACK.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        duration = time.perf_counter() - self.start
+        EVENTS.append({
+            'type': 'phase',
+            'stack': ';'.join(STACK),
+            'round': COUNTERS.get('rounds', 0),
+            'latency': duration
+        })
+        STACK.pop()
+        return False
+
+
+def phase(name):
+    """Context manager that records the time spent in a phase of verify."""
+    if not is_enabled():
+        return _NO_PHASE
+    return _Phase(name)
+
+
+def _call(kind, site, size, call, args):
+    start = time.perf_counter()
+    result = call(*args)
+    EVENTS.append({
+        'type': kind,
+        'stack': ';'.join(STACK + [site]),
+        'round': COUNTERS.get('rounds', 0),
+        'site': site,
+        'size': size,
+        'result': result if isinstance(result, bool) else None,
+        'latency': time.perf_counter() - start
+    })
+    return result
+
+
+def solver_call(site, formula, call, *args):
+    """Calls call(*args), e.g. is_sat(formula) or solver.solve(), and records
+    it as a solver call of the site on the formula."""
+    count('solver_calls')
+    if not is_enabled():
+        return call(*args)
+    return _call('solver', site, formula.size(), call, args)
+
+
+def fit(site, points, call, *args):
+    """Calls call(*args) and records it as a fit of a separator on points."""
+    count('separator_fits')
+    if not is_enabled():
+        return call(*args)
+    return _call('fit', site, len(points), call, args)
+
+
+def summary():
+    """Aggregates the events per phase, per call site and per round."""
+    aggregated = {'phases': {}, 'sites': {}, 'rounds': {}}
+    for event in EVENTS:
+        rounds = aggregated['rounds'].setdefault(event['round'], {
+            'phases': {}, 'solver_calls': 0, 'solver_time': 0.0, 'fits': 0, 'fit_time': 0.0
+        })
+        if event['type'] == 'phase':
+            entry = aggregated['phases'].setdefault(event['stack'], {'calls': 0, 'time': 0.0})
+            rounds['phases'][event['stack']] = (
+                rounds['phases'].get(event['stack'], 0.0) + event['latency'])
+        else:
+            entry = aggregated['sites'].setdefault(event['site'], {
+                'calls': 0, 'time': 0.0, 'sat': 0, 'unsat': 0, 'size': 0
+            })
+            entry['sat'] += event['result'] is True
+            entry['unsat'] += event['result'] is False
+            entry['size'] += event['size']
+            if event['type'] == 'solver':
+                rounds['solver_calls'] += 1
+                rounds['solver_time'] += event['latency']
+            else:
+                rounds['fits'] += 1
+                rounds['fit_time'] += event['latency']
+        entry['calls'] += 1
+        entry['time'] += event['latency']
+    return aggregated
+
+
+def get_folded():
+    """Returns the events in the folded stack format of flamegraph.pl, one
+    line per stack with its self time in microseconds."""
+    inclusive = {}
+    for event in EVENTS:
+        inclusive[event['stack']] = inclusive.get(event['stack'], 0.0) + event['latency']
+    exclusive = dict(inclusive)
+    for stack, latency in inclusive.items():
+        parent = stack.rpartition(';')[0]
+        if parent in exclusive:
+            exclusive[parent] -= latency
+    return '\n'.join(
+        '%s %d' % (stack, max(0, round(latency * 1e6))) for stack, latency in sorted(exclusive.items())
+    )
+
+
+def write_trace(path):
+    """Writes the events and their summary as json and the folded stacks
+    next to it."""
+    with open(path, 'w') as file:
+        json.dump({'events': EVENTS, 'summary': summary(), 'counters': COUNTERS}, file)
+    with open(path + '.folded', 'w') as file:
+        file.write(get_folded() + '\n')
@@ -0,0 +1,111 @@
+from fractions import Fraction
+from functools import reduce
+import math
+import numpy as np
+from scipy.optimize import linprog
+from sklearn import svm
+from settings import SETTINGS
+from profiling import fit
+
+
+###
+# Separators
+# A separator finds a hesse normal form (a, b, c) with a * x + b * y + c > 0
+# for all positive points and for as few negative points as possible. It
+# returns the form, a function that tells which points are on the positive
+# side and the fitted classifier if there is one (used for plotting), or
+# None if it knows that no form exists.
+###
+def svc_separator(positive, negative):
+    # shape the data for the support vector machine
+    negative = np.asarray(negative).reshape(-1, np.shape(positive)[-1])
+    x = np.vstack([positive, negative])
+    y = np.append(np.ones(len(positive), int), np.zeros(len(negative), int))
+
+    # run the support vector machine
+    clf = svm.SVC(kernel='linear', C=1000)
+    fit('svc', x, clf.fit, x, y)
+
+    # calculate the hesse normal form
+    form = tuple(
+        int(round(value * SETTINGS['HESSE_FORM_MULTIPLIER']))
+        for value in list(clf.coef_[0]) + [clf.intercept_[0]]
+    )
+    return form, lambda points: clf.predict(points) > 0, clf
+
+
+def _is_separating(form, positive, negative):
+    # integer check of the strict separation
+    weights = np.array(form[:-1], int)
+    return bool(
+        np.all(np.dot(positive, weights) + form[-1] > 0) and
+        np.all(np.dot(negative, weights) + form[-1] <= 0)
+    )
+
+
+def _to_integers(values):
+    # smallest integer multiple of the rational approximation of the values
+    fractions = [
+        Fraction(float(value)).limit_denominator(SETTINGS['SEPARATOR']['MAX_DENOMINATOR'])
+        for value in values
+    ]
+    multiple = reduce(lambda a, b: a * b // math.gcd(a, b), [f.denominator for f in fractions], 1)
+    integers = [int(f * multiple) for f in fractions]
+    divisor = reduce(math.gcd, integers, 0)
+    if divisor > 1:
+        integers = [value // divisor for value in integers]
+    return tuple(integers)
+
+
+def lp_separator(positive, negative):
+    """Solves the separation as a linear program: minimize |a| + |b| subject to
+    a * x + b * y + c >= 1 for positive and <= -1 for negative points. The
+    rational optimum is scaled to small integers and checked exactly; if it
+    does not separate the points the support vector machine is used. Returns
+    None if the points can not be separated."""
+    positive = np.unique(np.asarray(positive, int).reshape(-1, np.shape(negative)[-1]), axis=0)
+    negative = np.asarray(negative, int).reshape(-1, positive.shape[1])
+    dimension = positive.shape[1]
+
+    # positive points that do not span the space leave the direction of the
+    # L1-minimal form open, the optimum is then an axis through them
+    if np.linalg.matrix_rank(positive[1:] - positive[0]) < dimension:
+        return svc_separator(positive, negative)
+
+    # variables: a+, b+, a-, b-, c with a = a+ - a-
+    cost = np.append(np.ones(2 * dimension), 0)
+    constraints = np.vstack([
+        np.hstack([-positive, positive, -np.ones((len(positive), 1))]),
+        np.hstack([negative, -negative, np.ones((len(negative), 1))])
+    ])
+    bounds = 2 * dimension * [(0, None)] + [(None, None)]
+    result = fit('lp', constraints, lambda: linprog(
+        cost,
+        A_ub=constraints,
+        b_ub=-np.ones(len(constraints)),
+        bounds=bounds,
+        method='highs'
+    ))
+    if result.status != 0:
+        return None
+
+    solution = result.x[:dimension] - result.x[dimension:2 * dimension]
+    form = _to_integers(list(solution) + [result.x[-1]])
+    if not _is_separating(form, positive, negative):
+        return svc_separator(positive, negative)
+    weights = np.array(form[:-1])
+    return form, lambda points: np.dot(points, weights) + form[-1] > 0, None
+
+
+SEPARATORS = {
+    'SVC': svc_separator,
+    'LP': lp_separator
+}
+
+
+def get_separator(name=None):
+    if name is None:
+        name = SETTINGS['SEPARATOR']['BACKEND']
+    if name not in SEPARATORS:
+        raise Exception("Separator needs to be one of %s." % ', '.join(SEPARATORS.keys()))
+    return SEPARATORS[name]
@@ -12,6 +12,40 @@ SETTINGS = {
         'MARGIN_MULTIPLIER': 10,
         'MIRROR_ADD': 20
     },
+    'EVALUATE': {
+        'ACCELERATE': True,
+        'BATCH': True,
+        'MEMO': True,
+        'SAMPLES': 8,
+        'STEPS': 1000,
+        'WORKERS': 1
+    },
+    'VERIFY': {
+        'CACHE': None,
+        'CHUNK': 64,
+        'CONCURRENT': False,
+        'COUNTEREXAMPLES': 5,
+        'DISTANCE': 3,
+        'HEAD_START': 0.05,
+        'PIPELINE': False,
+        'PORTFOLIO': False,
+        'PRECHECK': True
+    },
+    'SEPARATOR': {
+        'BACKEND': 'SVC',
+        'MAX_DENOMINATOR': 1000
+    },
+    'MEMO_SIZE': {
+        'FORMULAS': 65536,
+        'PROGRAMS': 64
+    },
+    'PROFILE': {
+        'ENABLED': False
+    },
+    'FRONTEND': {
+        'CACHE': None,
+        'LARGE_BLOCKS': True
+    },
     'HESSE_FORM_MULTIPLIER': 10,
     'PRINT': True, 
     'PLOT': False,
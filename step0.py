@@ -1,122 +1,418 @@
-from pysmt.shortcuts import Symbol, LE, GE, Int, GT, LT, And, Equals, Plus, Solver, is_sat, Or, Not, Minus, Ite, Implies, is_unsat, get_model, Times, Not, simplify
+from pysmt.shortcuts import Symbol, LE, GE, Int, GT, LT, And, Equals, Plus, Solver, is_sat, Or, Not, Minus, Ite, Implies, is_unsat, get_model, Times, Not, simplify, get_env
 from pysmt.typing import INT, STRING, BOOL, REAL
-from sklearn import svm
+from pysmt.parsing import parse
+from pysmt.logics import QF_LIA
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import functools
+import multiprocessing
+import multiprocessing.connection
 import numpy as np
 from settings import SETTINGS
 from programs import code_1, code_2, code_3, code_4
-from utils import get_var, get_mirror_point, plot_sp, get_variables_from_formula
+from utils import get_var, get_mirror_point, plot_sp, get_model_values
+from execution import compile_program
+from transitions import TransitionStore
+from points import PointStore
+from candidates import Candidate
+from frontend import compile_source
+import cache
+from separators import get_separator
+from profiling import count, record, phase, solver_call, reset, collect, merge
 
 
 ###
 # Invariant check
 ###
 def get_substitution(code, place='body', replace_index=False):
-    substitution = {}
-    for key in code['map'].keys():
-        index = code['map'][key]['pre'] if replace_index else None
-        if place == 'body':
-            substitution[get_var(key, index)] = get_var(
-                key, code['map'][key]['body'])
-        elif place == 'pre':
-            substitution[get_var(key, index)] = get_var(
-                key, code['map'][key]['pre'])
+    # the maps are built once per program, see Program.substitutions
+    if place not in ['body', 'pre']:
+        raise Exception("Place needs to be 'body' or 'pre'.")
+    return compile_program(code).substitutions[(place, replace_index)]
+
+
+class VerificationContext:
+    """Long-lived solvers for the checks (4), (5) and (6) of one program.
+
+    The parts of the checks that do not depend on the invariant are asserted
+    once, when the check is first run; every candidate invariant is checked
+    between a push and a pop. The solvers are pysmt's default or the named
+    backend, e.g. 'z3'."""
+
+    def __init__(self, code, backend=None):
+        self.code = code
+        self.backend = backend
+        self.pre_substitution = get_substitution(code, 'pre')
+        self.body_substitution = get_substitution(code, 'body')
+
+        # the symbols of a counterexample, the state before the body for (4)
+        # and (5) and after it for (6)
+        program = compile_program(code)
+        self.pre_vars = program.pre_vars
+        self.body_vars = program.body_vars
+
+        self.assertions = [
+            # test (4)
+            # pre ∧ ¬invariant
+            code['pre'],
+            # test (5)
+            # sp(invariant ∧ cond, body) ∧ ¬invariant
+            And(code['cond'], code['body']),
+            # test (6)
+            # invariant ∧ ¬cond ∧ ¬post
+            And(Not(program.body_cond), Not(code['post']))
+        ]
+        self.solvers = [None, None, None]
+
+    def _get_solver(self, index):
+        if self.solvers[index] is None:
+            self.solvers[index] = Solver(name=self.backend)
+            self.solvers[index].add_assertion(self.assertions[index])
+        return self.solvers[index]
+
+    def _check(self, name, index, formula, symbols):
+        # returns up to SETTINGS['VERIFY']['COUNTEREXAMPLES'] counterexamples
+        # as states, the values of the symbols, or None
+        solver = self._get_solver(index)
+        solver.push()
+        try:
+            solver.add_assertion(formula)
+            error_points = []
+            while len(error_points) < SETTINGS['VERIFY']['COUNTEREXAMPLES']:
+                if not solver_call(name, formula, solver.solve):
+                    break
+                values = get_model_values(solver.get_model(), symbols)
+                error_points.append(values)
+
+                # the next counterexample has to differ by at least DISTANCE
+                # in one of the variables
+                distance = SETTINGS['VERIFY']['DISTANCE']
+                solver.add_assertion(Or([
+                    Or(GE(symbol, Int(int(value) + distance)), LE(symbol, Int(int(value) - distance)))
+                    for symbol, value in zip(symbols, values)
+                ]))
+            if len(error_points) == 0:
+                return None
+            return np.array(error_points)
+        finally:
+            solver.pop()
+
+    def get_checks(self, invariant):
+        # the name, the index, the invariant dependent formula and the
+        # symbols of the counterexamples of (4), (5) and (6)
+        pre_invariant = invariant.substitute(self.pre_substitution)
+        body_invariant = invariant.substitute(self.body_substitution)
+        return [
+            ('initiation', 0, Not(pre_invariant), self.pre_vars),
+            ('consecution', 1, And(pre_invariant, Not(body_invariant)), self.pre_vars),
+            ('exit', 2, body_invariant, self.body_vars)
+        ]
+
+    def check(self, index, invariant):
+        return self._check(*self.get_checks(invariant)[index])
+
+    def is_invariant_correct(self, invariant):
+        for name, index, formula, symbols in self.get_checks(invariant):
+            error_points = self._check(name, index, formula, symbols)
+            if error_points is not None:
+                return (False, error_points)
+        return (True, ())
+
+    def close(self):
+        for solver in self.solvers:
+            if solver is not None:
+                solver.exit()
+
+
+###
+# Forked workers
+# A worker process answers messages, e.g. invariants in the string format of
+# serialize, until it gets None. It is forked so that the pysmt formulas do
+# not need to be pickled; the counters and events of every answer are sent
+# with it.
+###
+def _serve(connection, get_handler, args):
+    reset()
+    handle = get_handler(*args)
+    while True:
+        message = connection.recv()
+        if message is None:
+            return
+        connection.send((handle(message), collect()))
+
+
+class ForkedWorker:
+    """A worker process with the handler get_handler(*args), built in the
+    worker. Restarting it kills the process, e.g. to cancel a message, and
+    forks a new one."""
+
+    def __init__(self, get_handler, *args):
+        self.get_handler = get_handler
+        self.args = args
+        self._start()
+
+    def _start(self):
+        context = multiprocessing.get_context('fork')
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve,
+            args=(worker_connection, self.get_handler, self.args),
+            daemon=True
+        )
+        self.process.start()
+
+    def send(self, message):
+        self.connection.send(message)
+
+    def receive(self):
+        # raises EOFError if the worker died
+        result, collected = self.connection.recv()
+        merge(collected)
+        return result
+
+    def restart(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self._start()
+
+    def close(self):
+        if self.process.is_alive():
+            self.connection.send(None)
+        self.process.join()
+        self.connection.close()
+
+
+def _check_handler(code, index):
+    # runs one of the checks (4), (5) or (6) for every received invariant
+    context = VerificationContext(code)
+    return lambda invariant: context.check(index, parse(invariant))
+
+
+class ConcurrentVerificationContext:
+    """Runs the checks (4), (5) and (6) at the same time in three worker
+    processes. The first counterexample is returned at once; the workers of
+    the other checks are killed and forked again for the next invariant."""
+
+    def __init__(self, code):
+        self.code = code
+        self.workers = [ForkedWorker(_check_handler, code, index) for index in range(3)]
+
+    def is_invariant_correct(self, invariant):
+        for worker in self.workers:
+            worker.send(invariant.serialize())
+        running = {worker.connection: worker for worker in self.workers}
+        error_points = None
+        while len(running) != 0 and error_points is None:
+            for connection in multiprocessing.connection.wait(list(running.keys())):
+                error_points = running.pop(connection).receive()
+                if error_points is not None:
+                    break
+        # cancel the checks that are still running
+        for worker in running.values():
+            worker.restart()
+        if error_points is not None:
+            return (False, error_points)
+        return (True, ())
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+###
+# Portfolio
+# Every check is raced on all installed solvers; the wins per query shape
+# decide which solver starts first
+###
+def get_backends():
+    # the names of the installed pysmt solvers for integer arithmetic
+    return sorted(get_env().factory.all_solvers(logic=QF_LIA).keys())
+
+
+# wins of every backend per query shape, e.g. WINS[('exit', 7)]['z3']
+WINS = {}
+
+
+def get_shape(name, invariant):
+    # the check and the order of magnitude of the size of the invariant
+    return (name, invariant.size().bit_length())
+
+
+def _portfolio_handler(code, backend):
+    # runs the received checks (4), (5) or (6) on one backend
+    context = VerificationContext(code, backend)
+    return lambda message: context.check(message[0], parse(message[1]))
+
+
+class PortfolioVerificationContext:
+    """Races the checks (4), (5) and (6) on all installed solvers, one worker
+    process per solver. The solver that won most often on queries of the same
+    shape starts first, the others join after SETTINGS['VERIFY']['HEAD_START']
+    seconds. The first answer is taken; the workers that are still running
+    are killed and forked again."""
+
+    def __init__(self, code, backends=None):
+        self.code = code
+        self.backends = get_backends() if backends is None else backends
+        self.workers = {backend: ForkedWorker(_portfolio_handler, code, backend) for backend in self.backends}
+
+    def _race(self, index, name, invariant):
+        wins = WINS.setdefault(get_shape(name, invariant), {})
+        backends = sorted(self.backends, key=lambda backend: -wins.get(backend, 0))
+        message = (index, invariant.serialize())
+        running = {}
+
+        def start(backends):
+            for backend in backends:
+                self.workers[backend].send(message)
+                running[self.workers[backend].connection] = backend
+
+        # the best backend gets a head start
+        start(backends[:1])
+        waiting = backends[1:]
+        if not multiprocessing.connection.wait(list(running.keys()), SETTINGS['VERIFY']['HEAD_START']):
+            start(waiting)
+            waiting = []
+        while len(running) != 0:
+            for connection in multiprocessing.connection.wait(list(running.keys())):
+                backend = running.pop(connection)
+                try:
+                    error_points = self.workers[backend].receive()
+                except EOFError:
+                    # the worker died, e.g. the backend raised; the others go on
+                    count('failures_' + backend)
+                    self.workers[backend].restart()
+                    continue
+                wins[backend] = wins.get(backend, 0) + 1
+                count('wins_' + backend)
+
+                # cancel the backends that are still running
+                for loser in running.values():
+                    self.workers[loser].restart()
+                return error_points
+            if len(running) == 0:
+                start(waiting)
+                waiting = []
+        raise Exception("Every solver backend failed on the %s check." % name)
+
+    def is_invariant_correct(self, invariant):
+        for index, name in enumerate(['initiation', 'consecution', 'exit']):
+            error_points = self._race(index, name, invariant)
+            if error_points is not None:
+                return (False, error_points)
+        return (True, ())
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.close()
+
+
+_verification_contexts = {}
+
+
+def get_verification_context(code):
+    context = _verification_contexts.get(id(code))
+    if context is None or context.code is not code:
+        close_verification_context(code)
+        if SETTINGS['VERIFY']['PORTFOLIO']:
+            context = PortfolioVerificationContext(code)
+        elif SETTINGS['VERIFY']['CONCURRENT']:
+            context = ConcurrentVerificationContext(code)
         else:
-            raise Exception("Place needs to be 'body' or 'pre'.")
-    return substitution
+            context = VerificationContext(code)
+        _verification_contexts[id(code)] = context
+    return context
 
 
-def is_invariant_correct(code, invariant):
-    # test (4)
-    # pre ∧ ¬invariant
-    formula = And(
-        code['pre'],
-        Not(invariant.substitute(get_substitution(code, 'pre')))
-    )
-    if is_sat(formula):
-        return (False, get_variables_from_formula(formula))
-
-    # test (5)
-    # sp(invariant ∧ cond, body) ∧ ¬invariant
-    sp = And(
-        code['cond'],
-        code['body'],
-        invariant.substitute(get_substitution(code, 'pre'))
-    )
-    formula = And(
-        sp,
-        Not(invariant.substitute(get_substitution(code, 'body')))
-    )
-    if is_sat(formula):
-        return (False, get_variables_from_formula(formula))
-
-    # test (6)
-    # invariant ∧ ¬cond ∧ ¬post
-    formula = And(
-        invariant.substitute(get_substitution(code, 'body')),
-        Not(code['cond'].substitute(get_substitution(code, 'body', True))),
-        Not(code['post'])
-    )
-    if is_sat(formula):
-        return (False, get_variables_from_formula(formula))
+def close_verification_context(code):
+    # stops the worker processes of the context of the program, if any
+    context = _verification_contexts.pop(id(code), None)
+    if context is not None:
+        context.close()
 
-    return (True, ())
 
+def is_invariant_correct(code, invariant):
+    return get_verification_context(code).is_invariant_correct(invariant)
+
+
+def find_violations(code, candidate, single_points, store=None):
+    """Checks (4), (5) and (6) on the known states and the recorded
+    transitions only. Returns up to SETTINGS['VERIFY']['COUNTEREXAMPLES']
+    states of the first failing check and whether every invariant has to
+    contain them: the states of pre outside of the candidate for (4), for
+    (5) the successors outside of it of positive states inside of it or else
+    the other states inside of it with a successor outside of it, the states
+    inside of it that end outside of post for (6).
+
+    With SETTINGS['EVALUATE']['ACCELERATE'] the successor of a stored state
+    can be the target of an accelerated jump, i.e. s ⇒* s' instead of
+    s ⇒ s'. It is reached from s either way."""
+    program = compile_program(code)
+    signatures = functools.partial(get_signatures, code)
+    labels = single_points.labels()
+    states = np.concatenate([single_points[label] for label in labels])
+    inside = candidate.evaluate(
+        states, np.concatenate([single_points.get_signatures(label, signatures) for label in labels]))
+    violations = [
+        # pre ∧ ¬invariant
+        (states[program.pre_batch(states) & ~inside], True),
+        # invariant ∧ ¬cond ∧ ¬post
+        (states[inside & ~program.cond_batch(states) & ~program.post_batch(states)], False)
+    ]
+    if store is not None and len(store) != 0:
+        # s ∈ invariant, s ⇒ s', s' ∉ invariant
+        stored = candidate.evaluate(store.states, store.get_signatures(signatures))
+        ids = np.flatnonzero(store.successors >= 0)
+        ids = ids[stored[ids] & ~stored[store.successors[ids]]]
+        # only the successor of a positive state is known to be reachable
+        positive = single_points.known(store.states[ids], ['POSITIVE'])
+        violations.insert(1, (store.states[store.successors[ids[positive]]], True))
+        violations.insert(2, (store.states[ids[~positive]], False))
+    for states, contained in violations:
+        if len(states) != 0:
+            states = np.unique(states, axis=0)
+            size = min(len(states), SETTINGS['VERIFY']['COUNTEREXAMPLES'])
+            return (states[np.random.choice(len(states), size, replace=False)], contained)
+    return (np.empty((0, single_points.dimension), int), False)
+
+
+def add_violations(single_points, violations, hesse_normal_forms):
+    # the states every invariant has to contain are REQUIRED points, which
+    # the learner treats as positive points, unless they end in an error;
+    # the mirror points of all of them are simulated. Returns whether there
+    # is something new to learn from.
+    error_points, contained = violations
+    new = 0
+    if contained:
+        new = single_points.add('REQUIRED', error_points[~single_points.known(error_points, ['CE', 'NEGATIVE'])])
+    unknown = single_points.count('UNKNOWN')
+    add_error_points(single_points, error_points, hesse_normal_forms, True)
+    return new != 0 or single_points.count('UNKNOWN') != unknown
+
+
+def evaluate_point(code, variables, store=None):
+    program = compile_program(code)
 
-def evaluate_point(code, variables):
     # s := variables
-    numbers = And()
-    for key, item in variables.items():
-        numbers = And(numbers, Equals(get_var(key), Int(item)))
+    state = program.get_state(variables)
 
     # s ∈ pre
-    formula = And(
-        code['pre'],
-        numbers.substitute(get_substitution(code, 'pre'))
-    )
-    pre = is_sat(formula)
+    pre = program.pre(state)
 
     # s ⇒ s'
     # return all s and s'
-    def body(variables):
-        variables_list = [variables]
-
-        numbers = And()
-        for key, item in variables.items():
-            numbers = And(numbers, Equals(get_var(key), Int(item)))
-
-        cond = And(
-            code['cond'],
-            numbers.substitute(get_substitution(code, 'pre'))
-        )
-        if is_sat(cond):
-            formula = And(
-                code['body'],
-                numbers.substitute(get_substitution(code, 'pre'))
-            )
-            variables = get_variables_from_formula(formula, 'highest')
-            variables_list += body(variables)
-
-        return variables_list
-
-    # s' := last point in variables list
-    variables_list = body(variables)
-    numbers = And()
-    for key, item in variables_list[-1].items():
-        numbers = And(numbers, Equals(get_var(key), Int(item)))
+    states, diverged = program.run(state, store)
+    variables_list = [program.get_variables(state) for state in states]
+    if diverged:
+        # the loop did not end within the step budget
+        return ('DIVERGES', variables_list)
 
     # s' ∈ cond
-    formula = And(
-        code['cond'],
-        numbers.substitute(get_substitution(code, 'pre'))
-    )
-    cond = is_sat(formula)
+    cond = program.cond(states[-1])
 
     # s' ∈ post
-    formula = And(
-        code['post'],
-        numbers.substitute(get_substitution(code, 'body'))
-    )
-    post = is_sat(formula)
+    post = program.post(states[-1])
 
     # evaluate
     if pre and not cond and not post:
@@ -134,74 +430,381 @@ def evaluate_point(code, variables):
     return (evaluation, variables_list)
 
 
+def evaluate_points(code, points, store=None):
+    program = compile_program(code)
+
+    # s ⇒ s' for all points in lockstep
+    # return s', all s and s' and the point each of them belongs to
+    final_states, states, owners, diverged = program.run_batch(points, store)
+
+    # s ∈ pre, s' ∈ cond, s' ∈ post
+    pre = program.pre_batch(points)
+    cond = program.cond_batch(final_states)
+    post = program.post_batch(final_states)
+
+    # evaluate, NP = REST
+    evaluations = np.full(len(points), 'NP', dtype='<U8')
+    evaluations[pre & ~cond & ~post] = 'CE'
+    evaluations[pre & ~cond & post] = 'POSITIVE'
+    evaluations[~pre & ~cond & ~post] = 'NEGATIVE'
+    # the loop did not end within the step budget
+    evaluations[diverged] = 'DIVERGES'
+    return (evaluations, states, owners)
+
+
+def classify_points(code, points, store=None):
+    # returns all s and s' of the points and their evaluation
+    if SETTINGS['EVALUATE']['BATCH']:
+        evaluations, states, owners = evaluate_points(code, points, store)
+        return (states, evaluations[owners])
+    program = compile_program(code)
+    states = [np.empty((0, len(program.variables)), int)]
+    evaluations = [np.empty(0, '<U8')]
+    for point in points:
+        evaluation, variables_list = evaluate_point(code, program.get_variables(point), store)
+        states.append(np.array([program.get_state(variables) for variables in variables_list]))
+        evaluations.append(np.full(len(variables_list), evaluation, '<U8'))
+    return (np.concatenate(states), np.concatenate(evaluations))
+
+
+###
+# Parallel evaluation
+# Every worker process compiles the program once and keeps its own solver
+# and transition store over all rounds. The new transitions of a chunk are
+# returned with its points and merged into the store of verify.
+###
+_worker = {}
+
+
+def _initialize_worker(code, store):
+    # the store is the one of verify at the time of the fork
+    reset()
+    _worker['code'] = code
+    _worker['store'] = store
+    compile_program(code)
+
+
+def _classify_chunk(points):
+    # the transitions, counters and events of the chunk are returned with
+    # its points
+    store = _worker['store']
+    start = 0 if store is None else len(store)
+    states, evaluations = classify_points(_worker['code'], points, store)
+    transitions = None if store is None else store.get_transitions(start)
+    return (states, evaluations, transitions, collect())
+
+
+def get_executor(code, workers, store=None):
+    # fork the workers so that the pysmt formulas and the store do not need
+    # to be pickled
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_initialize_worker,
+        initargs=(code, store)
+    )
+
+
+def _merge_chunk(result, store):
+    states, evaluations, transitions, collected = result
+    if store is not None and transitions is not None:
+        store.merge(transitions)
+    merge(collected)
+    return (states, evaluations)
+
+
+def classify_points_parallel(executor, points, workers, store=None):
+    chunks = [chunk for chunk in np.array_split(points, workers * 4) if len(chunk) != 0]
+    states = [np.empty((0, points.shape[1]), int)]
+    evaluations = [np.empty(0, '<U8')]
+    for result in executor.map(_classify_chunk, chunks):
+        chunk_states, chunk_evaluations = _merge_chunk(result, store)
+        states.append(chunk_states)
+        evaluations.append(chunk_evaluations)
+    return (np.concatenate(states), np.concatenate(evaluations))
+
+
 ###
 # Verify function
 # Finds correct invariants
 ###
-def verify(code):
-    single_points = {}
-    for valuation in ['CE', 'NEGATIVE', 'NP', 'POSITIVE', 'UNKNOWN']:
-        single_points[valuation] = np.empty((0,2), int)
+def add_error_points(single_points, error_points, hesse_normal_forms, new_only=False):
+    # calculate mirror points to hesse forms and add them as error points
+    for error_point in error_points:
+        points = [error_point] + [get_mirror_point(form, error_point) for form in hesse_normal_forms]
+        points = np.vstack([np.reshape(point, (-1, single_points.dimension)) for point in points]).astype(int)
+        if new_only:
+            points = points[~single_points.known(points)]
+        single_points.add('UNKNOWN', points)
+
+
+def verify(code, workers=None):
+    # the source of a loop is compiled into a program dict
+    if isinstance(code, str):
+        code = compile_source(code)
+    # one dimension per state variable
+    dimension = len(code['map'])
+    single_points = PointStore(dimension)
 
     # generate points
     unknown = np.random.randint(
         low = SETTINGS['POINTS']['GENERATE']['LOW'], 
         high = SETTINGS['POINTS']['GENERATE']['HIGH'],
-        size = (SETTINGS['POINTS']['GENERATE']['START'], 2),
+        size = (SETTINGS['POINTS']['GENERATE']['START'], dimension),
         dtype=int
     )
-    single_points['UNKNOWN'] = unknown
+    single_points.add('UNKNOWN', unknown)
+
+    # remember simulated transitions over all rounds
+    store = None
+    if SETTINGS['EVALUATE']['MEMO']:
+        store = TransitionStore(dimension)
+
+    # evaluate points in worker processes
+    if workers is None:
+        workers = SETTINGS['EVALUATE']['WORKERS']
+    executor = None
+
+    try:
+        # warm start from an earlier run, its invariant only needs to be checked
+        invariant = cache.load(code, single_points, store)
+        if invariant is not None:
+            with phase('check'):
+                invariant_correct, error_points = is_invariant_correct(code, invariant)
+            if invariant_correct:
+                count('cache_hits')
+                return invariant
+            single_points.add('UNKNOWN', error_points)
+
+        if workers > 1:
+            executor = get_executor(code, workers, store)
+        if SETTINGS['VERIFY']['PIPELINE']:
+            return asyncio.run(verify_pipelined(code, single_points, store, executor, workers))
+
+        # find an invariant
+        while True:
+            count('rounds')
 
-    # find an invariant
-    while True:
-        # evaluate points
-        for point in single_points['UNKNOWN']:
-            evaluation, points = evaluate_point(code, {'x': int(point[0]), 'y': int(point[1])})
-            points = np.array(list(map(lambda point: [point['x'], point['y']], points)))
-            single_points[evaluation] = np.append(single_points[evaluation], points, axis=0)
-        single_points['UNKNOWN'] = np.empty((0,2), int)
+            # evaluate points
+            with phase('evaluate'):
+                if executor is None:
+                    points, evaluations = classify_points(code, single_points['UNKNOWN'], store)
+                else:
+                    points, evaluations = classify_points_parallel(
+                        executor, single_points['UNKNOWN'], workers, store)
+            for evaluation in ['CE', 'DIVERGES', 'NEGATIVE', 'NP', 'POSITIVE']:
+                single_points.add(evaluation, points[evaluations == evaluation])
+            single_points.clear('UNKNOWN')
+            for evaluation in ['CE', 'DIVERGES', 'NEGATIVE', 'NP', 'POSITIVE']:
+                record('points_' + evaluation, single_points.count(evaluation))
         
-        # break if disproved
-        if len(single_points['CE']) != 0:
-            return 'DISPROVED'
+            # break if disproved
+            if len(single_points['CE']) != 0:
+                cache.save(code, single_points, store)
+                return 'DISPROVED'
+
+            # get a possible invariant
+            # invariant, hesse_normal_forms = find_conjunctive_invariant(single_points)
+            with phase('learn'):
+                invariant, hesse_normal_forms, candidate = find_disjunctive_invariant(single_points, code)
+
+            # print
+            if SETTINGS['PRINT']:
+                print(
+                    SETTINGS['#'], 'testing invariant\n',
+                    invariant.serialize()
+                )
 
-        # get a possible invariant
-        # invariant, hesse_normal_forms = find_conjunctive_invariant(single_points)
-        invariant, hesse_normal_forms = find_disjunctive_invariant(single_points, code)
+            # check the candidate on the known states and transitions first,
+            # the solver is only asked if that gives nothing new
+            learn = False
+            if SETTINGS['VERIFY']['PRECHECK']:
+                with phase('precheck'):
+                    violations = find_violations(code, candidate, single_points, store)
+                    if len(violations[0]) != 0:
+                        count('precheck_violations')
+                    learn = add_violations(single_points, violations, hesse_normal_forms)
+
+            if not learn:
+                # check if the invariant is actually correct
+                with phase('check'):
+                    invariant_correct, error_points = is_invariant_correct(code, invariant)
+
+                # return invariant if correct
+                if invariant_correct:
+                    cache.save(code, single_points, store, invariant)
+                    return invariant
+
+                add_error_points(single_points, error_points, hesse_normal_forms)
+
+            # print
+            if SETTINGS['PRINT']:
+                print(
+                    SETTINGS['#'], 'verify error_points\n',
+                    single_points['UNKNOWN']
+                )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        close_verification_context(code)
 
-        # print
-        if SETTINGS['PRINT']:
-            print(
-                SETTINGS['#'], 'testing invariant\n',
-                invariant.serialize()
-            )
 
-        # check if the invariant is actually correct
-        invariant_correct, error_point = is_invariant_correct(code, invariant)
-        
-        # return invariant if correct
-        if invariant_correct:
-            return invariant
-        
-        # calculate mirror points to hesse forms and add to sp
-        error_points = np.empty((0, 2), int)
-        error_point = np.array([error_point['x'], error_point['y']], dtype=int)
-        error_points = np.vstack([error_points, error_point])
-        for form in hesse_normal_forms:
-            error_points = np.vstack([error_points, get_mirror_point(*form, *error_point)])
-
-        # print
-        if SETTINGS['PRINT']:
-            print(
-                SETTINGS['#'], 'verify error_points\n',
-                error_points
-            )
-        
-        # add the error points
-        single_points['UNKNOWN'] = np.append(single_points['UNKNOWN'], error_points, axis=0)
-        
+###
+# Pipelined verify
+# Simulation, learning and checking overlap: the unknown points are simulated
+# in chunks, a candidate is learned when no check is running and enough new
+# points are labeled and checked in a forked process while the next chunks are
+# simulated. A check is
+# cancelled as soon as new points contradict its candidate.
+###
+def _checker_handler(code):
+    # runs the checks (4), (5) and (6) for every received invariant
+    context = VerificationContext(code)
+    return lambda invariant: context.is_invariant_correct(parse(invariant))
+
+
+class Checker:
+    """Checks invariants in a forked process without blocking the event
+    loop. Cancelling a check kills the process and forks a new one."""
+
+    def __init__(self, code):
+        self.code = code
+        self.worker = ForkedWorker(_checker_handler, code)
+
+    async def is_invariant_correct(self, invariant):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        descriptor = self.worker.connection.fileno()
+        self.worker.send(invariant.serialize())
+        loop.add_reader(descriptor, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        except asyncio.CancelledError:
+            loop.remove_reader(descriptor)
+            self.worker.restart()
+            raise
+        loop.remove_reader(descriptor)
+        return self.worker.receive()
+
+    def close(self):
+        self.worker.close()
+
+
+def _contradicts(code, candidate, points, evaluations):
+    # a reachable state outside of the candidate or a state inside of it
+    # that ends in an error
+    inside = candidate.evaluate(points, get_signatures(code, points))
+    return bool(
+        np.any(~inside & (evaluations == 'POSITIVE')) or
+        np.any(inside & (evaluations == 'NEGATIVE'))
+    )
 
-def find_conjunctive_invariant(single_points):
+
+async def _cancel(check):
+    check.cancel()
+    try:
+        await check
+    except asyncio.CancelledError:
+        pass
+
+
+def _take_chunk(single_points, size):
+    # removes the next chunk of unknown points, at least CHUNK of them since
+    # every batch steps as long as its longest trace
+    unknown = single_points['UNKNOWN']
+    chunk = unknown[:max(size, SETTINGS['VERIFY']['CHUNK'])]
+    single_points.clear('UNKNOWN')
+    single_points.add('UNKNOWN', unknown[len(chunk):])
+    return chunk
+
+
+async def verify_pipelined(code, single_points, store=None, executor=None, workers=1):
+    """The loop of verify as a pipeline, see SETTINGS['VERIFY']['PIPELINE'].
+    With an executor up to one chunk per worker is simulated at a time. The
+    chunks grow with the labeled points, so that the labels double with
+    every round of chunks."""
+    checker = Checker(code)
+    check = None
+    running = set()
+    invariant = hesse_normal_forms = candidate = None
+    # labeled points in total and when the last candidate was learned
+    labeled = learned = 0
+    try:
+        while True:
+            # simulate the next chunks of unknown points
+            results = []
+            with phase('evaluate'):
+                if executor is None:
+                    if single_points.count('UNKNOWN') != 0:
+                        results.append(classify_points(code, _take_chunk(single_points, labeled), store))
+                        await asyncio.sleep(0)
+                else:
+                    while len(running) < workers and single_points.count('UNKNOWN') != 0:
+                        chunk = _take_chunk(single_points, labeled // workers)
+                        running.add(asyncio.wrap_future(executor.submit(_classify_chunk, chunk)))
+                    if len(running) != 0:
+                        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                        results = [_merge_chunk(future.result(), store) for future in done]
+            for points, evaluations in results:
+                labeled += len(points)
+                for evaluation in ['CE', 'DIVERGES', 'NEGATIVE', 'NP', 'POSITIVE']:
+                    single_points.add(evaluation, points[evaluations == evaluation])
+                    record('points_' + evaluation, single_points.count(evaluation))
+
+                # break if disproved
+                if len(single_points['CE']) != 0:
+                    cache.save(code, single_points, store)
+                    return 'DISPROVED'
+
+                # the running check is stale if the new points contradict it
+                if check is not None and _contradicts(code, candidate, points, evaluations):
+                    count('cancelled_checks')
+                    await _cancel(check)
+                    check = None
+
+            # wait for the check if there is nothing left to simulate
+            simulating = single_points.count('UNKNOWN') != 0 or len(running) != 0
+            if check is not None and (check.done() or not simulating):
+                invariant_correct, error_points = await check
+                check = None
+                if invariant_correct:
+                    cache.save(code, single_points, store, invariant)
+                    return invariant
+                add_error_points(single_points, error_points, hesse_normal_forms)
+                continue
+            if check is not None:
+                continue
+
+            # relearn once the labels have doubled or everything is simulated,
+            # a candidate per chunk costs more than it saves
+            if simulating and labeled < 2 * learned:
+                continue
+
+            # get a possible invariant
+            count('rounds')
+            learned = labeled
+            with phase('learn'):
+                invariant, hesse_normal_forms, candidate = find_disjunctive_invariant(single_points, code)
+
+            # the solver only gets candidates that hold on the known states
+            learn = False
+            if SETTINGS['VERIFY']['PRECHECK']:
+                with phase('precheck'):
+                    violations = find_violations(code, candidate, single_points, store)
+                    if len(violations[0]) != 0:
+                        count('precheck_violations')
+                    learn = add_violations(single_points, violations, hesse_normal_forms)
+            if not learn:
+                check = asyncio.ensure_future(checker.is_invariant_correct(invariant))
+    finally:
+        for future in running:
+            future.cancel()
+        if check is not None:
+            await _cancel(check)
+        checker.close()
+
+
+def find_conjunctive_invariant(single_points, variables=None):
     # print
     if SETTINGS['PRINT']:
         print(SETTINGS['#'], 'find_conjunctive_invariant single_points')
@@ -214,6 +817,9 @@ def find_conjunctive_invariant(single_points):
     if SETTINGS['PLOT']:
         plot_sp(single_points)
 
+    if variables is None:
+        variables = [get_var('x'), get_var('y')]
+    separate = get_separator()
     complete_invariant = And()
     negative = single_points['NEGATIVE']
     positive = single_points['POSITIVE']
@@ -221,36 +827,33 @@ def find_conjunctive_invariant(single_points):
 
     while(len(negative) != 0):
 
-        # shape the data for the support vector machine
+        # separate the positive points from a random negative point
         random_negative_point = negative[np.random.choice(len(negative)), :]
-        x = np.vstack([positive, random_negative_point])
-        y = np.append(np.ones(len(positive), int), np.array([0]))
-
-        # run the support vector machine
-        clf = svm.SVC(kernel='linear', C=1000)
-        clf.fit(x, y)
-
-        # calculate the hesse normal form
-        a = int(round(clf.coef_[0][0] * SETTINGS['HESSE_FORM_MULTIPLIER']))
-        b = int(round(clf.coef_[0][1] * SETTINGS['HESSE_FORM_MULTIPLIER']))
-        c = int(round(clf.intercept_[0] * SETTINGS['HESSE_FORM_MULTIPLIER']))
+        separation = separate(positive, random_negative_point)
+        if separation is not None:
+            form, predict, clf = separation
+            inside = predict(negative)
+        if separation is None or np.all(inside):
+            # no halfspace with all positive points excludes the point, it
+            # stays inside of the invariant
+            count('inseparable_points')
+            negative = negative[np.any(negative != random_negative_point, axis=1)]
+            continue
         
         # save the hesse normal form for later
-        hesse_normal_forms.append((a, b, c))
+        hesse_normal_forms.append(form)
 
         # set the invariant that correctly classifies positive points
         invariant = GT(
             Plus(
-                Times(Int(a), get_var('x')),
-                Times(Int(b), get_var('y')), 
-                Int(c)
+                [Times(Int(weight), variable) for weight, variable in zip(form, variables)] +
+                [Int(form[-1])]
             ), 
             Int(0)
         )
 
         # remove successfully classified from negative
-        prediction = clf.predict(negative)
-        negative = negative[prediction > 0]
+        negative = negative[inside]
         
         # plot
         if SETTINGS['PLOT']:
@@ -270,84 +873,70 @@ def find_conjunctive_invariant(single_points):
     return complete_invariant, hesse_normal_forms
 
 
-def find_disjunctive_invariant(single_points, code):
-    path_seperations = 2 ** len(code['paths'])
-    # cond_seperation = 1
-    cond_seperation = path_seperations
-    single_points_seperated = (path_seperations + cond_seperation) * [[]]
-    for i in range(path_seperations + cond_seperation):
-        single_points_seperated[i] = {'POSITIVE': np.empty((0,2), int), 'NEGATIVE': np.empty((0,2), int)}
-    
-    cond = code['cond'].substitute({get_var('x1'): get_var('x'), get_var('y1'): get_var('y')})
-    path_conditions = path_seperations * [cond] + cond_seperation * [Not(cond)]
+def get_region(code, signature):
+    # bit j of the signature tells whether path j is taken, the bit after
+    # the paths whether cond is false
+    program = compile_program(code)
+    paths = len(program.plain_paths)
+    region = Not(program.plain_cond) if signature & 2 ** paths else program.plain_cond
+    for j, path in enumerate(program.plain_paths):
+        region = And(region, path if signature & 2 ** j else Not(path))
+    return region
 
-    path_allocation = {}
-    for i in range(len(code['paths'])):
-        path_allocation[2**i] = code['paths'][i]
 
-    for i in range(path_seperations):
-        k = i
-        while True:
-            for key, path in path_allocation.items():
-                if key > k:
-                    path_conditions[i] = And(path_conditions[i], Not(path))
-                else:
-                    path_conditions[i] = And(path_conditions[i], path)
-                    k -= key
-            if k == 0:
-                break
-    
-    if cond_seperation != 1:
-        for i in range(path_seperations):
-            k = i
-            while True:
-                for key, path in path_allocation.items():
-                    if key > k:
-                        path_conditions[i+2] = And(path_conditions[i+2], Not(path))
-                    else:
-                        path_conditions[i+2] = And(path_conditions[i+2], path)
-                        k -= key
-                if k == 0:
-                    break
+def get_signatures(code, points):
+    # cond and every path are compiled once; the regions are never evaluated
+    program = compile_program(code)
+    paths = len(program.plain_paths)
+    signatures = np.where(program.get_predicate(program.plain_cond)(points), 0, 2 ** paths)
+    for j, path in enumerate(program.plain_paths):
+        signatures |= program.get_predicate(path)(points) * 2 ** j
+    return signatures
 
-    for valuation in ['POSITIVE', 'NEGATIVE']:
-        for point in single_points[valuation]:
-            assert_check = False
-            for i in range(len(path_conditions)):
-                sat = is_sat(
-                    And(
-                        path_conditions[i], 
-                        Equals(get_var('x'), Int(point[0])), 
-                        Equals(get_var('y'), Int(point[1]))
-                    )
-                )
-                assert_check = assert_check or sat
-                if sat:
-                    single_points_seperated[i][valuation] = (
-                        np.vstack([single_points_seperated[i][valuation], point])
-                    )
-            assert assert_check == True
+
+def find_disjunctive_invariant(single_points, code):
+    # only the regions that hold positive points become disjuncts, so the
+    # invariant grows with the observed behaviours and not with 2 ** paths;
+    # the REQUIRED states are positive points as well
+    points = {
+        'POSITIVE': single_points['POSITIVE'],
+        'NEGATIVE': single_points['NEGATIVE']
+    }
+    if single_points.count('REQUIRED') != 0:
+        points['POSITIVE'] = np.unique(np.vstack([points['POSITIVE'], single_points['REQUIRED']]), axis=0)
+    signatures = {
+        'POSITIVE': get_signatures(code, points['POSITIVE']),
+        'NEGATIVE': single_points.get_signatures('NEGATIVE', functools.partial(get_signatures, code))
+    }
 
     all_hesse_normal_forms = []
     complete_invariant = Or()
-    for i in range(len(single_points_seperated)):
-        single_points_seperated[i]['NP'] = single_points['NP']
-        single_points_seperated[i]['CE'] = single_points['CE']
-        if len(single_points_seperated[i]['POSITIVE']) == 0 or len(single_points_seperated[i]['NEGATIVE']) == 0:
+    candidate = Candidate(len(compile_program(code).variables))
+    for signature in np.unique(signatures['POSITIVE']):
+        region = get_region(code, int(signature))
+        region_points = {
+            valuation: points[valuation][signatures[valuation] == signature]
+            for valuation in ['POSITIVE', 'NEGATIVE']
+        }
+        region_points['NP'] = single_points['NP']
+        region_points['CE'] = single_points['CE']
+        if len(region_points['NEGATIVE']) == 0:
             invariant = And()
             hesse_normal_forms = []
         else:
-            invariant, hesse_normal_forms = find_conjunctive_invariant(single_points_seperated[i])    
+            invariant, hesse_normal_forms = find_conjunctive_invariant(
+                region_points, compile_program(code).plain_vars)
         all_hesse_normal_forms += hesse_normal_forms
+        candidate.add(signature, hesse_normal_forms)
         if SETTINGS['PRINT']:
             print(
                 SETTINGS['#'], 'find_disjunctive_invariant path_condition\n',
-                path_conditions[i].serialize()
+                region.serialize()
             )
-        invariant = And(invariant, path_conditions[i])
+        invariant = And(invariant, region)
         complete_invariant = Or(complete_invariant, invariant)
-    
-    return complete_invariant, all_hesse_normal_forms
+
+    return complete_invariant, all_hesse_normal_forms, candidate
 
 
 ###
@@ -358,8 +947,9 @@ def find_disjunctive_invariant(single_points, code):
 # incorrect_invariant = LE(Symbol('x', INT), Plus(Symbol('y', INT), Int(9)))
 # print(is_invariant_correct(code_1, incorrect_invariant))
 
-test_code = code_1
-print(SETTINGS['#'], 'final result\n', simplify(verify(test_code)).serialize())
+if __name__ == '__main__':
+    test_code = code_1
+    print(SETTINGS['#'], 'final result\n', simplify(verify(test_code)).serialize())
 # print(is_invariant_correct(test_code, Or()))
 # print(evaluate(code_2, {'x': 0, 'y': -1}))
 # print(evaluate_point(code_1, {'x': 323, 'y': 324}))
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+import programs
+from settings import SETTINGS
+from frontend import compile_source
+from execution import compile_program
+from transitions import DIVERGES, TransitionStore
+from step0 import evaluate_point, evaluate_points, get_executor, classify_points_parallel
+
+
+# x = 0 needs 11 steps, x = 5 only 6
+COUNTER = '''
+while x < 11:
+    x = x + 1
+'''
+
+# runs in a cycle for y > 0, x < 0 leads into it
+CYCLE = '''
+while y > 0:
+    if x < 3:
+        x = x + 1
+    else:
+        x = 0
+'''
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'STEPS', 10)
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'ACCELERATE', False)
+
+
+def evaluate(code, point, store):
+    return evaluate_points(code, np.array([point]), store)[0][0]
+
+
+@pytest.mark.parametrize('first, second', [([0], [5]), ([5], [0])])
+def test_budget_is_not_stored(budget, first, second):
+    # whether a trace runs out of steps depends on its own steps, not on the
+    # trace that stored the states it reaches
+    code = compile_source(COUNTER)
+    store = TransitionStore(1)
+    for point in [first, second]:
+        expected = evaluate_point(code, {'x': point[0]})[0]
+        assert evaluate(code, point, None) == expected
+        assert evaluate(code, point, store) == expected
+    assert evaluate(code, [0], store) == 'DIVERGES'
+    assert evaluate(code, [5], store) == 'POSITIVE'
+
+
+def get_codes():
+    return [programs.code_1, programs.code_2, programs.code_3, programs.code_4, compile_source(CYCLE)]
+
+
+def get_points(code, seed):
+    # random points with repeated and neighbouring points, so that traces
+    # join each other
+    points = np.random.default_rng(seed).integers(-15, 16, (60, len(code['map'])))
+    return np.concatenate([points, points[:10], points[:10] + 1])
+
+
+def check_store(store):
+    # every state once, traces that end count down to their final state
+    assert np.all(store.find(store.states) == np.arange(len(store)))
+    ids = np.flatnonzero(store.finals != DIVERGES)
+    following = ids[store.successors[ids] >= 0]
+    assert np.all(store.lengths[following] > store.lengths[store.successors[following]])
+    ending = ids[store.successors[ids] < 0]
+    assert np.all(store.finals[ending] == ending)
+    assert np.all(store.lengths[ending] == 0)
+
+
+def check_agrees(code, points, evaluations, states, owners):
+    # the labels and visited states of the scalar evaluation, a jump only
+    # visits some of the states on its way
+    program = compile_program(code)
+    for i, point in enumerate(points):
+        evaluation, variables_list = evaluate_point(code, program.get_variables(point))
+        assert evaluations[i] == evaluation
+        expected = {tuple(program.get_state(variables)) for variables in variables_list}
+        visited = {tuple(state) for state in states[owners == i]}
+        if SETTINGS['EVALUATE']['ACCELERATE']:
+            assert visited <= expected
+        else:
+            assert visited == expected
+
+
+@pytest.mark.parametrize('steps', [3, 10, 1000])
+@pytest.mark.parametrize('accelerate', [False, True])
+@pytest.mark.parametrize('index', range(5))
+def test_batch_agrees_with_scalar(monkeypatch, steps, accelerate, index):
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'STEPS', steps)
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'ACCELERATE', accelerate)
+    code = get_codes()[index]
+    store = TransitionStore(len(code['map']))
+    for seed in range(3):
+        points = get_points(code, seed)
+        check_agrees(code, points, *evaluate_points(code, points, None))
+        check_agrees(code, points, *evaluate_points(code, points, store))
+        check_store(store)
+
+
+@pytest.mark.parametrize('accelerate', [False, True])
+def test_cycle_is_walked_round(monkeypatch, accelerate):
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'ACCELERATE', accelerate)
+    code = compile_source(CYCLE)
+    store = TransitionStore(2)
+    points = np.array([[x, y] for x in range(-6, 4) for y in range(1, 3)])
+    assert np.all(evaluate_points(code, points, store)[0] == 'DIVERGES')
+    assert np.all(store.finals == DIVERGES)
+
+    # from every state the walk goes round the cycle, one step at a time
+    # without jumps
+    ids, starts, steps = store.follow(np.arange(len(store)), np.zeros(len(store), int), 20)
+    for start in range(len(store)):
+        walked = steps[starts == start]
+        assert walked[-1] > 20 - 4
+        assert np.all(np.diff(walked) > 0)
+        if not accelerate:
+            assert np.all(np.diff(walked) == 1)
+
+
+@pytest.mark.parametrize('accelerate', [False, True])
+def test_worker_transitions_are_merged(monkeypatch, accelerate):
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'STEPS', 10)
+    monkeypatch.setitem(SETTINGS['EVALUATE'], 'ACCELERATE', accelerate)
+    for code in get_codes():
+        store = TransitionStore(len(code['map']))
+        points = get_points(code, 0)
+        executor = get_executor(code, 2, store)
+        try:
+            classify_points_parallel(executor, points, 2, store)
+        finally:
+            executor.shutdown()
+        assert len(store) != 0
+        check_store(store)
+        check_agrees(code, points, *evaluate_points(code, points, store))
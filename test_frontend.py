@@ -0,0 +1,156 @@
+import numpy as np
+import pytest
+from pysmt.shortcuts import Iff, is_valid
+import programs
+from settings import SETTINGS
+from utils import get_var
+from frontend import compile_source, _compile_source
+from step0 import evaluate_point
+from cache import get_key
+
+
+# the programs of programs.py as sources
+SOURCES = {
+    'code_1': '''
+assert x < y
+while x < y:
+    if x < 0:
+        x = x + 7
+    else:
+        x = x + 10
+    if y < 0:
+        y = y - 10
+    else:
+        y = y + 3
+assert y <= x
+assert x <= y + 16
+''',
+    'code_2': '''
+assert x > 0 or y > 0
+while x + y <= -2:
+    if x > 0:
+        x = x + 1
+    else:
+        y = y + 1
+assert x > 0 or y > 0
+''',
+    'code_3': '''
+assert x == 1
+assert y == 0
+while x < 3:
+    x = x + y
+    y = y + 1
+assert x >= y
+''',
+    'code_4': '''
+assert x < 0
+while x < 0:
+    x = x + y
+    y = y + 1
+assert y > 0
+'''
+}
+
+# x is assigned twice on one path and once on the other
+TWICE = '''
+assert x < y
+while x < 10:
+    x = x + 1
+    if x < 5:
+        x = x * 2
+        y = y - x
+    y = y + x
+assert x <= y
+'''
+
+
+@pytest.fixture
+def large_blocks(request, monkeypatch):
+    monkeypatch.setitem(SETTINGS['FRONTEND'], 'LARGE_BLOCKS', request.param)
+    return request.param
+
+
+def get_symbols(code, place):
+    return {get_var(name, places[place]) for name, places in code['map'].items()}
+
+
+def rename(formula, code, place, other):
+    # the symbols of code at place as the ones of other
+    return formula.substitute({
+        get_var(name, places[place]): get_var(name, other['map'][name][place])
+        for name, places in code['map'].items()
+    })
+
+
+@pytest.mark.parametrize('large_blocks', [False, True], indirect=True)
+def test_places(large_blocks):
+    code = compile_source(TWICE)
+    assert code['map'] == {
+        'x': {'pre': 1, 'body': 2 if large_blocks else 3},
+        'y': {'pre': 1, 'body': 2 if large_blocks else 3}
+    }
+    # pre, cond and the paths are over the state at the loop head, post over
+    # the state after the body
+    for key in ['pre', 'cond']:
+        assert code[key].get_free_variables() <= get_symbols(code, 'pre')
+    assert code['post'].get_free_variables() == get_symbols(code, 'body')
+    assert [path.serialize() for path in code['paths']] == ['((x@1 + 1) < 5)']
+
+    # a large block relates the two states only, otherwise the body has the
+    # intermediate symbols as well
+    symbols = code['body'].get_free_variables()
+    assert get_symbols(code, 'pre') | get_symbols(code, 'body') <= symbols
+    assert (len(symbols) == 4) == large_blocks
+
+
+@pytest.mark.parametrize('large_blocks', [False, True], indirect=True)
+def test_disk_cache(tmp_path, monkeypatch, large_blocks):
+    monkeypatch.setitem(SETTINGS['FRONTEND'], 'CACHE', str(tmp_path))
+    _compile_source.cache_clear()
+    compiled = compile_source(TWICE)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # a new process only finds the program on disk
+    _compile_source.cache_clear()
+    loaded = compile_source(TWICE)
+    assert loaded is not compiled
+    assert loaded['map'] == compiled['map']
+    for key in ['pre', 'cond', 'body', 'post']:
+        assert is_valid(Iff(loaded[key], compiled[key]))
+    assert len(loaded['paths']) == len(compiled['paths'])
+    for loaded_path, compiled_path in zip(loaded['paths'], compiled['paths']):
+        assert is_valid(Iff(loaded_path, compiled_path))
+
+    # and it is the same program for the run cache
+    assert get_key(loaded) == get_key(compiled)
+    _compile_source.cache_clear()
+
+
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_same_formulas(monkeypatch, name):
+    # with large blocks the body only relates the two states, so every part
+    # is equivalent to the hand-written one
+    monkeypatch.setitem(SETTINGS['FRONTEND'], 'LARGE_BLOCKS', True)
+    code = compile_source(SOURCES[name])
+    expected = getattr(programs, name)
+    assert list(code['map']) == list(expected['map'])
+    for key, place in [('pre', 'pre'), ('cond', 'pre'), ('post', 'body')]:
+        assert is_valid(Iff(rename(code[key], code, place, expected), expected[key]))
+    body = rename(rename(code['body'], code, 'body', expected), code, 'pre', expected)
+    assert is_valid(Iff(body, expected['body']))
+    assert len(code['paths']) == len(expected['paths'])
+    for path, expected_path in zip(code['paths'], expected['paths']):
+        # the hand-written paths of code_2 use the plain symbols
+        expected_path = expected_path.substitute({get_var(variable): get_var(variable, 1) for variable in expected['map']})
+        assert is_valid(Iff(rename(path, code, 'pre', expected), expected_path))
+
+
+@pytest.mark.parametrize('large_blocks', [False, True], indirect=True)
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_same_runs(large_blocks, name):
+    code = compile_source(SOURCES[name])
+    expected = getattr(programs, name)
+    for point in np.random.default_rng(0).integers(-15, 16, (30, 2)):
+        variables = dict(zip(expected['map'], point))
+        evaluation, variables_list = evaluate_point(code, variables)
+        assert (evaluation, variables_list) == evaluate_point(expected, variables)
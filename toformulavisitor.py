@@ -1,19 +1,60 @@
 from collections import defaultdict
 import ast
 import copy
+import functools
 from pysmt.shortcuts import (
     Symbol,
     And,
     GE,
+    GT,
+    LE,
     LT,
     Plus,
-    Equals,
+    Minus,
+    Times,
+    EqualsOrIff,
     Int,
     TRUE,
     FALSE,
+    Not,
+    Or,
     get_model,
 )
 from pysmt.typing import INT
+from settings import SETTINGS
+from utils import get_var
+
+
+class FrontendError(Exception):
+    pass
+
+
+# the python operators that have a formula, e.g. x != y is Not(x = y)
+OPERATORS = {
+    ast.Add: Plus,
+    ast.Sub: Minus,
+    ast.Mult: Times,
+    ast.Lt: LT,
+    ast.LtE: LE,
+    ast.Gt: GT,
+    ast.GtE: GE,
+    ast.Eq: EqualsOrIff,
+    ast.NotEq: lambda left, right: Not(EqualsOrIff(left, right)),
+}
+
+
+# formulas built by any visitor, keyed by the type of the operator and the
+# operands; typed keeps the constants 1 and 1.0 apart
+@functools.lru_cache(maxsize=SETTINGS['MEMO_SIZE']['FORMULAS'], typed=True)
+def _build(op_type, *operands):
+    # op_type None builds an integer constant
+    if op_type is None:
+        if not isinstance(operands[0], int):
+            raise FrontendError("Unsupported constant %r." % operands[0])
+        return Int(operands[0])
+    if op_type in OPERATORS:
+        return OPERATORS[op_type](*operands)
+    raise FrontendError("Unsupported operator %s." % op_type.__name__)
 
 
 class ToFormulaVisitor(ast.NodeVisitor):
@@ -21,7 +62,8 @@ class ToFormulaVisitor(ast.NodeVisitor):
         if not ssamap:
             ssamap = defaultdict(lambda: 0)
         self.ssamap = ssamap
-        self.newssamap = copy.copy(ssamap)
+        # shared with ssamap until the first assignment copies it
+        self.newssamap = ssamap
         self.lstack = list()
         self.rstack = list()
 
@@ -39,16 +81,42 @@ class ToFormulaVisitor(ast.NodeVisitor):
         self.visit(node.right)
         rightResult = self.rstack.pop()
         leftResult = self.rstack.pop()
-        # generic mapping based on names, works ~90% of all cases, for the rest we have self._mapName:
-        operatorMethodName = "__%s__" % self._mapName(type(node.op).__name__.lower())
-        method = getattr(leftResult, operatorMethodName)
-        self.rstack.append(method(rightResult))
+        self.rstack.append(_build(type(node.op), leftResult, rightResult))
+
+    def visit_AugAssign(self, node):
+        # x += e is x = x + e
+        self.visit(node.value)
+        rightResult = self.rstack.pop()
+        leftResult = self.getValueOf(node.target.id)
+        self.rstack.append(_build(type(node.op), leftResult, rightResult))
+        self.visit(node.target)
 
-    def visit_Num(self, node):
-        self.rstack.append(Int(node.n))  # ?
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool):
+            self.rstack.append(TRUE() if node.value else FALSE())
+        else:
+            self.rstack.append(_build(None, node.value))
 
-    def visit_NameConstant(self, node):
-        self.rstack.append(TRUE() if node.value == True else FALSE())  # ?
+    def visit_BoolOp(self, node):
+        results = list()
+        for value in node.values:
+            self.visit(value)
+            results.append(self.rstack.pop())
+        self.rstack.append(And(results) if isinstance(node.op, ast.And) else Or(results))
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.operand)
+        operand = self.rstack.pop()
+        if isinstance(node.op, ast.Not):
+            self.rstack.append(Not(operand))
+        elif isinstance(node.op, ast.USub) and operand.is_int_constant():
+            self.rstack.append(Int(-operand.constant_value()))
+        elif isinstance(node.op, ast.USub):
+            self.rstack.append(-operand)
+        elif isinstance(node.op, ast.UAdd):
+            self.rstack.append(operand)
+        else:
+            raise FrontendError("Unsupported operator %s." % type(node.op).__name__)
 
     def visit_Compare(self, node):  # TODO: unify with BinOp -> remove code duplication
         self.visit(node.left)
@@ -57,23 +125,18 @@ class ToFormulaVisitor(ast.NodeVisitor):
         for comparator in node.comparators:
             self.visit(comparator)
             compResults.append(self.rstack.pop())
-        assert len(compResults) == 1
-        assert len(node.ops) == 1
-        op = node.ops[0]
-        operatorMethodName = "__%s__" % self._mapName(type(op).__name__.lower())
-        print(operatorMethodName)
-        method = getattr(leftResult, operatorMethodName)
-        self.rstack.append(method(compResults[0]))
-
-    def _mapName(self, methodName):
-        return "mul" if methodName == "mult" else methodName
+        if len(node.ops) != 1:
+            raise FrontendError("Chained comparisons are not supported.")
+        self.rstack.append(_build(type(node.ops[0]), leftResult, compResults[0]))
 
     def getValueOf(self, varname):
-        return Symbol("%s@%d" % (varname, self.ssamap[varname]), INT)
+        return get_var(varname, self.ssamap[varname])
 
     def getNewValueOf(self, varname):
+        if self.newssamap is self.ssamap:
+            self.newssamap = copy.copy(self.ssamap)
         self.newssamap[varname] += 1
-        return Symbol("%s@%d" % (varname, self.newssamap[varname]), INT)
+        return get_var(varname, self.newssamap[varname])
 
     # def update(self, othervaluation):
     #     for lhs, rhs in zip(self.lstack, self.rstack):
@@ -96,10 +159,10 @@ def mybody(x,y):
       x-=100
 """
 
-tree = ast.parse(program)
-tree2 = ast.parse('x = 10 + y * 5')
+if __name__ == '__main__':
+    tree2 = ast.parse('x = 10 + y * 5')
 
-tfv = ToFormulaVisitor(None)
-tfv.visit(tree2)
-print(tfv.lstack)
-print(tfv.rstack)
+    tfv = ToFormulaVisitor(None)
+    tfv.visit(tree2)
+    print(tfv.lstack)
+    print(tfv.rstack)
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+# the final state of a trace that runs in a cycle, see Program.run_batch
+DIVERGES = -2
+
+
+def get_keys(states):
+    # one hashable and sortable byte string per row
+    states = np.ascontiguousarray(states, dtype=np.int64)
+    return states.view(np.dtype((np.void, states.dtype.itemsize * states.shape[1]))).ravel()
+
+
+###
+# Transition store
+###
+class TransitionStore:
+    """Remembers every simulated state, its successor s', the last state of
+    the trace that starts in it and the number of steps to that state.
+
+    States get an id in the order they are added. The successor of a state
+    in which cond is false is -1. A trace that reaches a known state can stop
+    there; the rest of the trace is read from the store, and whether it runs
+    out of steps follows from its own steps and the stored length.
+
+    All states of a trace that runs in a cycle have the final DIVERGES; their
+    length is the number of steps until the trace comes back to a state it
+    visited, the successor of the last of them is that state. A trace that ran
+    out of steps before it ended is not stored, its states are simulated
+    again.
+    """
+
+    def __init__(self, dimension):
+        self.states = np.empty((0, dimension), int)
+        self.successors = np.empty(0, int)
+        self.finals = np.empty(0, int)
+        self.lengths = np.empty(0, int)
+        self._sorted_keys = get_keys(self.states)
+        self._order = np.empty(0, int)
+        self._signatures = np.empty(0, int)
+
+    def __len__(self):
+        return len(self.states)
+
+    def find(self, states):
+        """Returns the id of every row of states, -1 if it is unknown."""
+        ids = np.full(len(states), -1, int)
+        if len(self) == 0 or len(states) == 0:
+            return ids
+        keys = get_keys(states)
+        positions = np.minimum(np.searchsorted(self._sorted_keys, keys), len(self) - 1)
+        found = self._sorted_keys[positions] == keys
+        ids[found] = self._order[positions[found]]
+        return ids
+
+    def add(self, states, successors, finals, lengths):
+        """Adds unknown states, each once, with the ids of their successors
+        and final states and the number of steps to their final states."""
+        keys = get_keys(states)
+        order = np.argsort(keys)
+        # merge the sorted keys of the new states into the sorted keys
+        positions = np.searchsorted(self._sorted_keys, keys[order])
+        self._sorted_keys = np.insert(self._sorted_keys, positions, keys[order])
+        self._order = np.insert(self._order, positions, len(self) + order)
+        self.states = np.concatenate([self.states, states])
+        self.successors = np.concatenate([self.successors, successors])
+        self.finals = np.concatenate([self.finals, finals])
+        self.lengths = np.concatenate([self.lengths, lengths])
+
+    def get_signatures(self, signatures):
+        """Returns the path signature of every state. signatures(states) is
+        only called for the states added since the last call."""
+        if len(self._signatures) < len(self):
+            self._signatures = np.append(self._signatures, signatures(self.states[len(self._signatures):]))
+        return self._signatures
+
+    def get_transitions(self, start=0):
+        """Returns the states from id start on with their successors and final
+        states as states, whether their traces run in a cycle and their
+        lengths. A state without a successor is its own successor, e.g. to
+        merge them into a store of another process."""
+        ids = np.arange(start, len(self))
+        successors = np.where(self.successors[ids] >= 0, self.successors[ids], ids)
+        finals = np.where(self.finals[ids] >= 0, self.finals[ids], ids)
+        return (
+            self.states[ids], self.states[successors], self.states[finals], self.finals[ids] == DIVERGES,
+            self.lengths[ids]
+        )
+
+    def merge(self, transitions):
+        """Adds the unknown states of get_transitions of another store. Their
+        successors and final states are known by then, they were added before
+        or together with them."""
+        states, successors, finals, diverged, lengths = transitions
+        # the first of the rows of a state
+        new = np.zeros(len(states), bool)
+        new[np.unique(get_keys(states), return_index=True)[1]] = True
+        new &= self.find(states) == -1
+        if not np.any(new):
+            return
+        states, successors, finals, diverged, lengths = (
+            states[new], successors[new], finals[new], diverged[new], lengths[new])
+        start = len(self)
+        self.add(states, np.full(len(states), -1), np.full(len(states), DIVERGES), lengths)
+        self.successors[start:] = np.where(np.all(successors == states, axis=1), -1, self.find(successors))
+        self.finals[start:] = np.where(diverged, DIVERGES, self.find(finals))
+
+    def follow(self, ids, steps, budget):
+        """Walks from the given ids, reached after the given steps, to the end
+        of their traces, round and round in a cycle, as long as they take at
+        most budget steps. Returns the ids on the way, the index of the id
+        they were reached from and the steps after which they are reached."""
+        walked = []
+        walked_starts = []
+        walked_steps = []
+        ids = np.asarray(ids, int)
+        starts = np.arange(len(ids))
+        steps = np.asarray(steps, int)
+        while len(ids) != 0:
+            walked.append(ids)
+            walked_starts.append(starts)
+            walked_steps.append(steps)
+            successors = self.successors[ids]
+            # the successor of the last state of a cycle is further away
+            steps = steps + np.where(
+                self.lengths[successors] < self.lengths[ids],
+                self.lengths[ids] - self.lengths[successors], self.lengths[ids])
+            on = (successors >= 0) & (steps <= budget)
+            ids, starts, steps = successors[on], starts[on], steps[on]
+        if len(walked) == 0:
+            return ids, starts, steps
+        return np.concatenate(walked), np.concatenate(walked_starts), np.concatenate(walked_steps)
@@ -1,5 +1,6 @@
+import functools
 import numpy as np
-import math
+import os
 from settings import SETTINGS
 from pysmt.shortcuts import Symbol, LE, GE, Int, GT, LT, And, Equals, Plus, Solver, is_sat, Or, Not, Minus, Ite, Implies, is_unsat, get_model, Times, Not, simplify
 from pysmt.typing import INT, STRING, BOOL, REAL
@@ -9,24 +10,19 @@ import matplotlib.pyplot as plt
 ###
 # Helper functions
 ###
-def get_mirror_point(a, b, c, x1, y1): 
-    if (a * a + b * b) == 0:
-        return np.empty((0, 2), int)
-    if (a * x1 + b * y1 + c) == 0:
-        return np.array([
-            [x1 - SETTINGS['POINTS']['MIRROR_ADD'], y1], 
-            [x1 + SETTINGS['POINTS']['MIRROR_ADD'], y1], 
-            [x1, y1 - SETTINGS['POINTS']['MIRROR_ADD']], 
-            [x1, y1 + SETTINGS['POINTS']['MIRROR_ADD']]
-        ])
-    temp = -2 * (a * x1 + b * y1 + c) / (a * a + b * b)
-    x = temp * a + x1
-    y = temp * b + y1 
-    x = math.ceil(x) if x > x1 else math.floor(x)
-    y = math.ceil(y) if y > y1 else math.floor(y)
-    x = int(x)
-    y = int(y)
-    return np.array([x, y], int)
+def get_mirror_point(form, point):
+    # mirror the point at the hyperplane of the hesse normal form (a, b, ..., c);
+    # a point on it gives its neighbours at MIRROR_ADD in every variable
+    weights = np.array(form[:-1])
+    point = np.asarray(point, int)
+    if np.dot(weights, weights) == 0:
+        return np.empty((0, len(point)), int)
+    distance = np.dot(weights, point) + form[-1]
+    if distance == 0:
+        steps = SETTINGS['POINTS']['MIRROR_ADD'] * np.eye(len(point), dtype=int)
+        return np.vstack([point - steps, point + steps])
+    mirrored = -2 * distance / np.dot(weights, weights) * weights + point
+    return np.where(mirrored > point, np.ceil(mirrored), np.floor(mirrored)).astype(int)
 
 
 def plot_sp(single_points, clf=None):
@@ -60,33 +56,26 @@ def plot_sp(single_points, clf=None):
     plt.show()
 
 
+def write_atomic(path, write, mode='wb'):
+    # write and rename so that parallel runs never read half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = '%s.%d' % (path, os.getpid())
+    with open(temporary, mode) as file:
+        write(file)
+    os.replace(temporary, path)
+
+
+# symbols by name and ssa index, e.g. ('x', 1) for x@1; the @ can not be
+# part of a python name, so x@1 never clashes with a variable x1
+@functools.lru_cache(maxsize=SETTINGS['MEMO_SIZE']['FORMULAS'])
 def get_var(name, index=None):
-    if index is None:
-        return Symbol(name, INT)
-    return Symbol(name + str(index), INT)
+    return Symbol(name if index is None else '%s@%d' % (name, index), INT)
 
 
-def get_variables_from_formula(formula, index='lowest'):
-    assert index == 'lowest' or index == 'highest'
-    variables = get_model(formula).__iter__()
-    values = {}
-    for variable in variables:
-        name = variable[0].serialize()
-        key = name[0]
-        height = int(name[1:])
-        value = int(variable[1].serialize())
-        if index == 'lowest' and key in values.keys() and values[key]['height'] < height:
-            continue
-        if index == 'highest' and key in values.keys() and values[key]['height'] > height:
-            continue
-        values[key] = {
-            'value': value,
-            'height': height
-        }
-    variables = {}
-    for key, value in values.items():
-        variables[key] = value['value']
-    return variables
+def get_model_values(model, symbols):
+    """Reads the values of the symbols from a model into an integer vector,
+    without going through strings."""
+    return np.array([model.get_py_value(symbol) for symbol in symbols], dtype=np.int64)
 
 
 def find_points_from_formula(formula, n_points=20):